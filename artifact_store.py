@@ -0,0 +1,209 @@
+"""
+Content-addressed on-disk store for generated images
+
+Images are written once, as the raw bytes returned by the API, under a key
+derived from everything that determines them (model, final prompt, quality,
+style and size). Repeated requests are served from disk without another API
+call, and the store evicts the least recently used files past its size budget.
+A fresh variation of the same request is stored under a key of its own, so it
+never replaces an image a session is already showing.
+"""
+
+import os
+import json
+import base64
+import hashlib
+import tempfile
+import threading
+
+from response_cache import CONTENT_CACHE_DIR
+
+# Total size of stored images before the least recently used ones are evicted
+IMAGE_STORE_MAX_BYTES = int(os.environ.get("IMAGE_STORE_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Largest image accepted from the API or the CDN (a DALL-E 3 HD PNG is ~2-4 MB)
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+
+# Longest side (px) and JPEG quality of the preview thumbnails shown in the app
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", "512"))
+THUMBNAIL_QUALITY = 85
+
+# File extensions by leading magic bytes
+_IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": ".png",
+    b"\xff\xd8\xff": ".jpg",
+    b"RIFF": ".webp",
+}
+
+MIME_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".webp": "image/webp",
+}
+
+
+# File extension for raw image bytes (".png" when the format isn't recognised)
+def image_extension(data):
+    for signature, extension in _IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            return extension
+    return ".png"
+
+
+# Check that downloaded bytes are a complete image of a known format, without decoding it
+def verify_image_bytes(data, max_bytes=MAX_IMAGE_BYTES):
+    if not data:
+        raise ValueError("Empty image payload")
+    if len(data) > max_bytes:
+        raise ValueError(f"Image payload of {len(data)} bytes exceeds the {max_bytes} byte limit")
+
+    extension = None
+    for signature, signature_extension in _IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            extension = signature_extension
+    if extension is None:
+        raise ValueError("Image payload is not a PNG, JPEG or WebP file")
+
+    # Truncated downloads lose the end-of-image marker
+    if extension == ".png" and data[-12:] != b"\x00\x00\x00\x00IEND\xaeB`\x82":
+        raise ValueError("PNG image payload is truncated")
+    if extension == ".jpg" and not data.rstrip(b"\x00").endswith(b"\xff\xd9"):
+        raise ValueError("JPEG image payload is truncated")
+    if extension == ".webp" and (data[8:12] != b"WEBP" or int.from_bytes(data[4:8], "little") + 8 != len(data)):
+        raise ValueError("WebP image payload is truncated")
+
+
+# Decode a b64_json image, refusing payloads over the size limit before decoding them
+def decode_b64_image(b64_data, max_bytes=MAX_IMAGE_BYTES):
+    if len(b64_data) // 4 * 3 > max_bytes + 2:
+        raise ValueError(f"Image payload exceeds the {max_bytes} byte limit")
+    return base64.b64decode(b64_data, validate=True)
+
+
+class ArtifactStore:
+    """Thread-safe, size-bounded directory of generated image files"""
+
+    def __init__(self, directory=os.path.join(CONTENT_CACHE_DIR, "images"), max_bytes=IMAGE_STORE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    # Key of an image generation request
+    @staticmethod
+    def key(model, prompt, quality, style, size):
+        canonical = json.dumps(
+            {"model": model, "prompt": prompt, "quality": quality, "style": style, "size": size},
+            sort_keys=True, ensure_ascii=True
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    # Key of a fresh variation of the request behind `key`: a file of its own, so the image
+    # already stored under `key` (and every session showing it) stays as it is
+    @staticmethod
+    def variant_key(key, data):
+        return hashlib.sha256(key.encode() + hashlib.sha256(data).digest()).hexdigest()
+
+    def _base_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    # Path of the stored image for `key`, or None if it isn't in the store
+    def get_path(self, key):
+        base = self._base_path(key)
+        for extension in MIME_TYPES:
+            path = base + extension
+            if os.path.exists(path):
+                try:
+                    # Mark as recently used for eviction
+                    os.utime(path)
+                except OSError:
+                    break
+                with self._lock:
+                    self.hits += 1
+                return path
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # Write raw image bytes once under `key` and return the file path
+    def put(self, key, data):
+        path = self._base_path(key) + image_extension(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        # Previews of what was stored under the key before are stale now
+        for name in os.listdir(os.path.dirname(path)):
+            if name.startswith(key + ".thumb"):
+                try:
+                    os.remove(os.path.join(os.path.dirname(path), name))
+                except OSError:
+                    pass
+
+        self._evict(keep=path)
+        return path
+
+    # Path of a downscaled JPEG preview of a stored image, created on first use
+    def thumbnail_path(self, path, max_size=THUMBNAIL_SIZE):
+        thumb_path = f"{os.path.splitext(path)[0]}.thumb{max_size}.jpg"
+        if os.path.exists(thumb_path):
+            return thumb_path
+
+        # Pillow is only needed here, to decode the original once per thumbnail
+        from PIL import Image
+
+        with Image.open(path) as image:
+            image.thumbnail((max_size, max_size))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(thumb_path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                image.convert("RGB").save(f, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        os.replace(tmp_path, thumb_path)
+        return thumb_path
+
+    # Delete the least recently used images until the store fits its budget
+    def _evict(self, keep):
+        with self._lock:
+            files = []
+            total = 0
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self):
+        count = 0
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+                if ".thumb" not in name:
+                    count += 1
+        return {"hits": self.hits, "misses": self.misses, "images": count, "bytes": total}
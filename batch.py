@@ -0,0 +1,171 @@
+"""
+Headless batch generation
+
+Generates the full content set (LinkedIn post and three slides, tweet and image,
+WhatsApp image and message) for every row of a CSV or JSONL file, without the
+Streamlit UI. Rows are processed concurrently, and each row fans its API calls
+out like the app does.
+
+Usage:
+    python -m content_generator batch topics.csv [--output-dir batch_output]
+        [--workers 4] [--image-style Photorealistic] [--image-quality Standard]
+        [--cache] [--variants 1]
+
+Each row needs a `topic` and may set `persona` and `tone`. The API key is read
+from OPENAI_API_KEY (a .env file is loaded too). One JSON record per row is
+written to <output-dir>/results.jsonl, with the images copied to
+<output-dir>/images.
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from openai_transport import OpenAITransport
+from response_cache import ResponseCache
+from artifact_store import ArtifactStore
+from generation import ContentGenerator, ContentRequest
+from usage_ledger import UsageHistory
+from tracing import trace, write_trace
+
+DEFAULT_PERSONA = "Ogilvy-style storyteller"
+DEFAULT_TONE = "Professional"
+
+
+# Rows of a .csv (with a header line) or .jsonl topics file
+def read_topics(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    items = []
+    for number, row in enumerate(rows, start=1):
+        topic = (row.get("topic") or "").strip()
+        if not topic:
+            raise ValueError(f"{path}: row {number} has no topic")
+        items.append({
+            "topic": topic,
+            "persona": (row.get("persona") or "").strip() or DEFAULT_PERSONA,
+            "tone": (row.get("tone") or "").strip() or DEFAULT_TONE,
+        })
+    return items
+
+
+# Generate every artifact of one item and return its result record
+def generate_item(generator, item, index, images_dir, variants=1):
+    started = time.perf_counter()
+    artifacts = {}
+
+    with trace("batch_item", topic=item["topic"]) as item_trace:
+        run = generator.start(ContentRequest(item["topic"], item["persona"], item["tone"], variants=variants))
+        for result in run:
+            if result.error is not None:
+                artifacts[result.artifact] = {"error": str(result.error)}
+            elif result.variants is not None:
+                artifacts[result.artifact] = {"text": result.text, "variants": result.variants}
+            elif result.text is not None:
+                artifacts[result.artifact] = {"text": result.text}
+            else:
+                # Copy out of the image store, which evicts old images
+                image_path = os.path.join(images_dir, f"{index:04d}_{result.artifact}{os.path.splitext(result.image_path)[1]}")
+                shutil.copyfile(result.image_path, image_path)
+                artifacts[result.artifact] = {"image_path": image_path}
+
+    return {
+        **item,
+        "artifacts": {artifact: artifacts[artifact] for artifact in sorted(artifacts)},
+        "seconds": round(time.perf_counter() - started, 3),
+        "usage": run.usage.summary(),
+        "trace_file": write_trace(item_trace),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m content_generator batch",
+        description="Generate content sets for every topic in a CSV or JSONL file"
+    )
+    parser.add_argument("topics", help="CSV (with a header line) or JSONL file with topic, persona and tone")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--workers", type=int, default=4, help="topics generated at the same time")
+    parser.add_argument("--image-style", default="Photorealistic", choices=["Photorealistic", "Artistic", "Minimalist", "Infographic"])
+    parser.add_argument("--image-quality", default="Standard", choices=["Standard", "HD"])
+    parser.add_argument("--cache", action="store_true", help="reuse cached text responses")
+    parser.add_argument("--variants", type=int, default=1, help="versions of each post, ranked best first")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("set OPENAI_API_KEY (in the environment or a .env file)")
+
+    try:
+        items = read_topics(args.topics)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    images_dir = os.path.join(args.output_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+
+    transport = OpenAITransport()
+    image_store = ArtifactStore()
+    response_cache = ResponseCache() if args.cache else None
+    usage_history = UsageHistory()
+
+    started = time.perf_counter()
+    failed = 0
+    cost = 0.0
+    with open(os.path.join(args.output_dir, "results.jsonl"), "w", encoding="utf-8") as results_file:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = {
+                executor.submit(
+                    generate_item,
+                    ContentGenerator(api_key, transport, image_store, response_cache, args.image_style, args.image_quality),
+                    item, index, images_dir, max(1, args.variants)
+                ): index
+                for index, item in enumerate(items)
+            }
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # E.g. the output directory filling up: the item fails, the batch goes on
+                    record = {**items[futures[future]], "error": f"{type(e).__name__}: {e}", "artifacts": {}, "seconds": 0.0, "usage": {}}
+                errors = [artifact for artifact, entry in record["artifacts"].items() if "error" in entry]
+                failed += bool(errors) or "error" in record
+                if record["usage"]:
+                    usage_history.append(record["usage"], topic=record["topic"], batch=args.topics)
+                    cost += record["usage"]["total"]["cost"]
+                results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                results_file.flush()
+                if "error" in record:
+                    status = f"failed: {record['error']}"
+                else:
+                    status = f"{len(errors)} failed: {', '.join(errors)}" if errors else "ok"
+                print(
+                    f"[{futures[future] + 1}/{len(items)}] {record['topic']!r} {record['seconds']:.1f}s "
+                    f"~${record['usage'].get('total', {}).get('cost', 0.0):.3f} ({status})"
+                )
+
+    elapsed = time.perf_counter() - started
+    stats = transport.stats.snapshot()
+    print(
+        f"{len(items)} topics in {elapsed:.1f}s ({len(items) / elapsed * 60:.1f} per minute), "
+        f"{stats['requests']} API requests over {stats['connections']} connections, "
+        f"{stats['retries']} retries, {stats['throttled_seconds']:.1f}s rate limited, {failed} with errors, "
+        f"estimated cost ${cost:.2f}"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
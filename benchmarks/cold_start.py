@@ -0,0 +1,93 @@
+"""
+Cold start: import time and first paint of each entry point
+
+For every entry point (content_generator.py, app.py, streamlit_app.py) a
+fresh interpreter is started per run and measures:
+
+- import: `python -X importtime` total of importing the app module, and the
+  heaviest third-party packages it pulls in
+- first paint: the first script run of the page through Streamlit's AppTest
+  harness (the work a new server process does before the first session sees
+  the page), after `import streamlit` itself
+- rerun: a second script run in the same process, as on every widget
+  interaction
+
+Usage:
+    python benchmarks/cold_start.py [--runs 5]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ["content_generator.py", "app.py", "streamlit_app.py"]
+# Third-party packages worth watching in the import profile
+WATCHED = ["streamlit", "openai", "requests", "urllib3", "PIL", "sqlite3", "dotenv"]
+
+_FIRST_PAINT = """
+import sys, json, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=60)
+started = time.perf_counter()
+app.run()
+first = time.perf_counter() - started
+started = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - started
+print(json.dumps({"first_paint": first, "rerun": rerun, "errors": [e.value for e in app.exception]}))
+"""
+
+
+# Cumulative import time (microseconds) of the top-level modules imported by `import module`
+def import_profile(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if total.isdigit():
+            cumulative[name] = int(total)
+    return cumulative
+
+
+def first_paint(entry_point):
+    result = subprocess.run(
+        [sys.executable, "-c", _FIRST_PAINT, entry_point],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    profiles = [import_profile("content_generator") for _ in range(args.runs)]
+    total = statistics.median(profile["content_generator"] for profile in profiles) / 1000
+    watched = ", ".join(
+        f"{name} {statistics.median(profile.get(name, 0) for profile in profiles) / 1000:.0f} ms"
+        for name in WATCHED if any(name in profile for profile in profiles)
+    )
+    print(f"import content_generator: {total:.0f} ms (median of {args.runs}; {watched})")
+
+    for entry_point in ENTRY_POINTS:
+        runs = [first_paint(entry_point) for _ in range(args.runs)]
+        errors = [error for run in runs for error in run["errors"]]
+        print(
+            f"{entry_point:<22} first paint {statistics.median(run['first_paint'] for run in runs) * 1000:6.0f} ms, "
+            f"rerun {statistics.median(run['rerun'] for run in runs) * 1000:5.0f} ms"
+            + (f"  ({len(errors)} errors: {errors[0]})" if errors else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+End-to-end generation latency against the local OpenAI stand-in
+
+Starts benchmarks/mock_openai.py in-process and generates full content sets
+(three texts, the style guide, three LinkedIn slides and the shared image)
+through ContentGenerator and submit_artifacts, as the app does, once per
+strategy:
+
+- sequential: one worker, every call waits for the previous one
+- concurrent: MAX_GENERATION_WORKERS workers, the app's fan-out
+
+Each run is traced, so besides the p50/p95 end-to-end time the per-stage
+times come from the spans (chat calls, stream reading, HTTP requests,
+rate-limit waits, decoding, image verification and store writes). Peak
+memory is the largest Python allocation peak of a run (tracemalloc) and the
+process's peak RSS at the end.
+
+Usage:
+    python benchmarks/generation_latency.py [--runs 10] [--workers 1,8]
+        [--chat-latency lognormal:0.8,0.4] [--image-latency lognormal:6,0.3]
+        [--error-rate 0.0] [--throttle-rate 0.0] [--response-format b64_json]
+        [--no-stream] [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generation
+from openai_transport import OpenAITransport
+from artifact_store import ArtifactStore
+from generation import ARTIFACTS, MAX_GENERATION_WORKERS, ContentGenerator, GenerationError, submit_artifacts
+from tracing import trace
+from mock_openai import MockOpenAIServer
+
+TOPIC = "Why most digital transformations stall after the pilot"
+PERSONA = "Ogilvy-style storyteller"
+TONE = "Professional"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+# Generate one content set with `workers` threads; returns its wall time, spans and failures
+def run_once(generator, workers, run, stream):
+    on_text = (lambda artifact, text: None) if stream else None
+    failures = 0
+    started = time.perf_counter()
+    with trace("benchmark_run", workers=workers) as run_trace:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            # A distinct topic per run, so no image or response is reused between runs
+            futures, _ = submit_artifacts(generator, executor, f"{TOPIC} (run {run})", PERSONA, TONE, on_text=on_text)
+            wait(futures)
+            for future in futures:
+                try:
+                    future.result()
+                except GenerationError:
+                    failures += 1
+        finally:
+            executor.shutdown(wait=True)
+    return time.perf_counter() - started, run_trace.spans(), failures
+
+
+# Run a strategy `runs` times on a fresh transport and image store
+def bench_strategy(base_url, workers, runs, stream):
+    transport = OpenAITransport(base_url=base_url)
+    stage_durations = {}
+    run_seconds = []
+    peaks = []
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ArtifactStore(directory)
+        # Warm-up run: connections, imports and the limits learned from the headers
+        run_once(ContentGenerator("sk-mock", transport, store), workers, -1, stream)
+
+        for run in range(runs):
+            generator = ContentGenerator("sk-mock", transport, store)
+            tracemalloc.reset_peak()
+            seconds, spans, run_failures = run_once(generator, workers, run, stream)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            run_seconds.append(seconds)
+            failures += run_failures
+            for record in spans:
+                stage_durations.setdefault(record["name"], []).append(record["duration"])
+
+    return {
+        "workers": workers,
+        "runs": runs,
+        "p50_seconds": percentile(run_seconds, 0.50),
+        "p95_seconds": percentile(run_seconds, 0.95),
+        "mean_seconds": statistics.mean(run_seconds),
+        "peak_traced_mb": max(peaks) / 1024 / 1024,
+        "failures": failures,
+        "connections": transport.stats.snapshot(),
+        "stages": {
+            name: {
+                "calls_per_run": len(durations) / runs,
+                "seconds_per_run": sum(durations) / runs,
+                "p50_ms": percentile(durations, 0.50) * 1000,
+                "p95_ms": percentile(durations, 0.95) * 1000,
+            }
+            for name, durations in stage_durations.items()
+        },
+    }
+
+
+def print_result(result):
+    label = "sequential" if result["workers"] == 1 else f"concurrent ({result['workers']} workers)"
+    print(
+        f"\n{label}: p50 {result['p50_seconds']:.2f} s, p95 {result['p95_seconds']:.2f} s, "
+        f"mean {result['mean_seconds']:.2f} s over {result['runs']} runs, "
+        f"peak traced memory {result['peak_traced_mb']:.1f} MB, {result['failures']} failed artifacts, "
+        f"{result['connections']['retries']} retries"
+    )
+    print(f"  {'stage':<22} {'calls/run':>9} {'s/run':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    # Per-artifact task spans are summarised by the stages inside them
+    tasks = set(ARTIFACTS) | {"benchmark_run", "shared_image", "linkedin_style_guide"}
+    stages = {name: stage for name, stage in result["stages"].items() if name not in tasks}
+    for name, stage in sorted(stages.items(), key=lambda item: -item[1]["seconds_per_run"]):
+        print(
+            f"  {name:<22} {stage['calls_per_run']:>9.1f} {stage['seconds_per_run']:>8.2f} "
+            f"{stage['p50_ms']:>9.1f} {stage['p95_ms']:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--workers", default=f"1,{MAX_GENERATION_WORKERS}", help="comma-separated worker counts to compare")
+    parser.add_argument("--chat-latency", default="lognormal:0.8,0.4", help="seconds per chat completion")
+    parser.add_argument("--image-latency", default="lognormal:6,0.3", help="seconds per image generation")
+    parser.add_argument("--cdn-latency", default="fixed:0.15", help="seconds until an image URL starts sending")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--response-format", choices=["b64_json", "url"], default=generation.IMAGE_RESPONSE_FORMAT)
+    parser.add_argument("--no-stream", action="store_true", help="request the texts without streaming")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    generation.IMAGE_RESPONSE_FORMAT = args.response_format
+    server = MockOpenAIServer(
+        args.chat_latency, args.image_latency, args.cdn_latency, args.error_rate, args.throttle_rate,
+        args.retry_after, seed=args.seed
+    ).start()
+    print(
+        f"Mock API on {server.base_url}: chat {args.chat_latency}, image {args.image_latency}, "
+        f"errors {args.error_rate:.0%}, 429s {args.throttle_rate:.0%}, images as {args.response_format}"
+    )
+
+    tracemalloc.start()
+    results = []
+    try:
+        for workers in (int(value) for value in args.workers.split(",")):
+            result = bench_strategy(server.base_url, workers, args.runs, not args.no_stream)
+            print_result(result)
+            results.append(result)
+    finally:
+        tracemalloc.stop()
+        server.stop()
+
+    # ru_maxrss is in KB on Linux
+    print(f"\nprocess peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Per-run image payload: data-URI download links vs. thumbnails + download buttons
+
+Compares the bytes one "Generate Content" run pushes to the browser for its
+five image panels (three LinkedIn slides, Twitter, WhatsApp):
+
+- before: every panel sent the full image through st.image plus a PNG
+  re-encode of it, base64-embedded in the page as a data: download link
+- after: every panel sends a downscaled JPEG preview; the original bytes
+  are only transferred when a download button is clicked
+
+Usage:
+    python benchmarks/image_payload.py [image.png ...]
+
+Without arguments a noisy 1024x1024 PNG (similar in size to a DALL-E 3
+image) is generated.
+"""
+
+import os
+import io
+import sys
+import base64
+import argparse
+import tempfile
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from artifact_store import ArtifactStore
+
+PANELS = 5
+
+
+# A 1024x1024 PNG that compresses about as badly as a photographic DALL-E image
+def synthetic_image():
+    noise = Image.effect_noise((1024, 1024), 48)
+    gradient = Image.linear_gradient("L").resize((1024, 1024))
+    image = Image.merge("RGB", (noise, gradient, noise.rotate(90)))
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def measure(data, store):
+    # Before: st.image re-encoded the decoded PIL image, and the download link embedded
+    # another PNG encode as base64 in the page HTML
+    image = Image.open(io.BytesIO(data))
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    png = buffered.getvalue()
+    data_uri_html = len(f'<a href="data:image/png;base64,{base64.b64encode(png).decode()}" download="x.png"></a>')
+    before = {"page": data_uri_html, "media": len(png)}
+
+    # After: only the thumbnail is fetched; the download button's bytes travel on click
+    path = store.put(store.key("bench", str(len(data)), "standard", "bench", "1024x1024"), data)
+    after = {"page": 0, "media": os.path.getsize(store.thumbnail_path(path))}
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("images", nargs="*", help="image files to measure (default: a synthetic 1024x1024 PNG)")
+    args = parser.parse_args()
+
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    images = images or [synthetic_image()]
+    store = ArtifactStore(tempfile.mkdtemp())
+
+    for index, data in enumerate(images):
+        before, after = measure(data, store)
+        print(f"image {index + 1}: original {len(data) / 1024:.0f} KB")
+        for label, sizes in (("before", before), ("after", after)):
+            page = sizes["page"] * PANELS
+            media = sizes["media"] * PANELS
+            print(
+                f"  {label:<6} page HTML {page / 1024:8.0f} KB   media {media / 1024:8.0f} KB   "
+                f"total per run {(page + media) / (1024 * 1024):6.2f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Image retrieval latency: b64_json inline vs. URL + CDN download
+
+Runs a local stand-in for POST /v1/images/generations and for the image CDN,
+then times both retrieval strategies end to end through OpenAITransport:
+
+- b64_json: the image comes base64-encoded inside the API response
+- url: the API returns a URL and the image is downloaded (streamed, size
+  bounded) in a second request
+
+Both are verified with verify_image_bytes, as in the app.
+
+Usage:
+    python benchmarks/image_retrieval.py [--runs 20] [--api-latency 0.0]
+        [--cdn-ttfb 0.15] [--bandwidth-mbps 100]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai_transport import OpenAITransport
+from artifact_store import MAX_IMAGE_BYTES, decode_b64_image, verify_image_bytes
+
+
+# A 1024x1024 PNG about the size of a DALL-E 3 image
+def synthetic_image():
+    noise = Image.effect_noise((1024, 1024), 48)
+    gradient = Image.linear_gradient("L").resize((1024, 1024))
+    image = Image.merge("RGB", (noise, gradient, noise.rotate(90)))
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def start_server(image_bytes, api_latency, cdn_ttfb, bandwidth_mbps):
+    bytes_per_second = bandwidth_mbps * 1024 * 1024 / 8
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        # Send a body at the simulated link bandwidth
+        def send_body(self, body, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            chunk = 64 * 1024
+            for start in range(0, len(body), chunk):
+                self.wfile.write(body[start:start + chunk])
+                time.sleep(min(chunk, len(body) - start) / bytes_per_second)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(api_latency)
+            if payload.get("response_format") == "b64_json":
+                data = {"b64_json": base64.b64encode(image_bytes).decode()}
+            else:
+                data = {"url": f"http://{self.headers['Host']}/cdn/image.png"}
+            self.send_body(json.dumps({"data": [data]}).encode(), "application/json")
+
+        def do_GET(self):
+            time.sleep(cdn_ttfb)
+            self.send_body(image_bytes, "image/png")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def retrieve(transport, response_format):
+    payload = {"model": "dall-e-3", "prompt": "benchmark", "size": "1024x1024", "n": 1, "response_format": response_format}
+    response = transport.post_json("/images/generations", payload, "sk-benchmark")
+    image_data = response.json()["data"][0]
+    if image_data.get("b64_json"):
+        image_bytes = decode_b64_image(image_data["b64_json"])
+    else:
+        image_bytes = transport.download(image_data["url"], MAX_IMAGE_BYTES)
+    verify_image_bytes(image_bytes)
+    return image_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds the API takes to answer")
+    parser.add_argument("--cdn-ttfb", type=float, default=0.15, help="seconds until the CDN starts sending")
+    parser.add_argument("--bandwidth-mbps", type=float, default=100.0, help="simulated link bandwidth")
+    args = parser.parse_args()
+
+    image_bytes = synthetic_image()
+    server = start_server(image_bytes, args.api_latency, args.cdn_ttfb, args.bandwidth_mbps)
+    print(
+        f"image {len(image_bytes) / 1024:.0f} KB, cdn ttfb {args.cdn_ttfb * 1000:.0f} ms, "
+        f"{args.bandwidth_mbps:.0f} Mbit/s, {args.runs} runs"
+    )
+
+    for response_format in ("b64_json", "url"):
+        transport = OpenAITransport(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+        # Identical requests would otherwise be coalesced
+        transport.flights.ttl = 0
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            retrieve(transport, response_format)
+            timings.append(time.perf_counter() - start)
+        print(
+            f"  {response_format:<8} p50 {statistics.median(timings) * 1000:7.1f} ms   "
+            f"mean {statistics.mean(timings) * 1000:7.1f} ms   max {max(timings) * 1000:7.1f} ms"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
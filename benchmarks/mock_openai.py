@@ -0,0 +1,262 @@
+"""
+Local stand-in for the OpenAI API
+
+Serves POST /v1/chat/completions (regular and streamed), POST
+/v1/images/generations (b64_json or url) and the image "CDN" the URLs point
+at, with configurable latency distributions, injected server errors and 429
+throttling, so the app and the benchmarks can run without an API key.
+
+Latencies are given as "fixed:0.5", "uniform:0.2,0.8", "normal:0.8,0.2" or
+"lognormal:0.8,0.5" (median and sigma), in seconds.
+
+Usage:
+    python benchmarks/mock_openai.py [--port 8100] [--chat-latency lognormal:0.8,0.4]
+        [--image-latency lognormal:6,0.3] [--error-rate 0.02] [--throttle-rate 0.05]
+
+then run the app against it:
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 streamlit run content_generator.py
+"""
+
+import io
+import json
+import sys
+import math
+import time
+import base64
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Words the canned chat responses are made of
+_WORDS = (
+    "most teams get this wrong the real shift is quiet and it starts with one decision "
+    "nobody wants to make data says otherwise but the story is what people remember"
+).split()
+
+
+# A sampler of seconds for a latency spec such as "lognormal:0.8,0.4"
+def parse_latency(spec, rng=random):
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(rng.gauss(values[0], values[1]), 0.0)
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+# A 1024x1024 PNG about the size of a DALL-E 3 image
+def synthetic_image():
+    from PIL import Image
+
+    noise = Image.effect_noise((1024, 1024), 48)
+    gradient = Image.linear_gradient("L").resize((1024, 1024))
+    image = Image.merge("RGB", (noise, gradient, noise.rotate(90)))
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+class MockOpenAIServer:
+    """Threaded HTTP server answering like the OpenAI API, with injected latency and failures"""
+
+    def __init__(self, chat_latency="fixed:0.05", image_latency="fixed:0.2", cdn_latency="fixed:0.05",
+                 error_rate=0.0, throttle_rate=0.0, retry_after=1.0, image_bytes=None,
+                 stream_chunks=40, completion_words=120, port=0, seed=None):
+        self.rng = random.Random(seed)
+        self.chat_latency = parse_latency(chat_latency, self.rng)
+        self.image_latency = parse_latency(image_latency, self.rng)
+        self.cdn_latency = parse_latency(cdn_latency, self.rng)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.image_bytes = image_bytes or synthetic_image()
+        self.stream_chunks = stream_chunks
+        self.completion_words = completion_words
+        self.port = port
+
+        self._lock = threading.Lock()
+        self.counts = {}  # (path, status) -> requests
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                mock.handle_post(self, payload)
+
+            def do_GET(self):
+                time.sleep(mock.cdn_latency())
+                mock.send(self, 200, mock.image_bytes, "image/png")
+
+        class Server(ThreadingHTTPServer):
+            # Clients drop keep-alive connections whose error responses they didn't read
+            def handle_error(self, request, client_address):
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self._server = Server(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, path, status):
+        with self._lock:
+            self.counts[(path, status)] = self.counts.get((path, status), 0) + 1
+
+    def send(self, handler, status, body, content_type="application/json", headers=None):
+        self._count(handler.path.split("?")[0], status)
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _completion_text(self, index=0):
+        words = [self.rng.choice(_WORDS) for _ in range(self.completion_words)]
+        return f"Take {index + 1}: " + " ".join(words).capitalize() + "."
+
+    def handle_post(self, handler, payload):
+        # Limits high enough to never throttle on their own, so clients learn them from the headers
+        headers = {"x-ratelimit-limit-requests": "10000", "x-ratelimit-remaining-requests": "9999"}
+
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            body = {"error": {"type": "requests", "code": "rate_limit_exceeded", "message": "Rate limit reached"}}
+            return self.send(handler, 429, json.dumps(body).encode(), headers={
+                **headers, "Retry-After": str(self.retry_after), "x-ratelimit-remaining-requests": "0"
+            })
+        if roll < self.throttle_rate + self.error_rate:
+            body = {"error": {"type": "server_error", "message": "The server had an error"}}
+            return self.send(handler, 500, json.dumps(body).encode(), headers=headers)
+
+        if handler.path.endswith("/chat/completions"):
+            self.chat(handler, payload, headers)
+        elif handler.path.endswith("/images/generations"):
+            time.sleep(self.image_latency())
+            if payload.get("response_format") == "b64_json":
+                data = {"b64_json": base64.b64encode(self.image_bytes).decode()}
+            else:
+                data = {"url": f"http://{handler.headers['Host']}/cdn/{self.rng.getrandbits(64):x}.png"}
+            body = {"created": int(time.time()), "data": [{**data, "revised_prompt": payload.get("prompt", "")[:200]}]}
+            self.send(handler, 200, json.dumps(body).encode(), headers=headers)
+        else:
+            self.send(handler, 404, b'{"error": {"message": "Unknown path"}}')
+
+    def chat(self, handler, payload, headers):
+        headers = {**headers, "x-ratelimit-limit-tokens": "10000000", "x-ratelimit-remaining-tokens": "9999000"}
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in payload.get("messages", [])) // 4
+        texts = [self._completion_text(index) for index in range(payload.get("n", 1))]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": sum(len(text) // 4 for text in texts),
+            "total_tokens": prompt_tokens + sum(len(text) // 4 for text in texts),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        latency = self.chat_latency()
+
+        if not payload.get("stream"):
+            time.sleep(latency)
+            body = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [
+                    {"index": index, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                    for index, text in enumerate(texts)
+                ],
+                "usage": usage,
+            }
+            return self.send(handler, 200, json.dumps(body).encode(), headers=headers)
+
+        # Streamed: a third of the latency before the first token, the rest spread over the chunks
+        self._count(handler.path, 200)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+
+        def write_event(data):
+            event = f"data: {data}\n\n".encode()
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+            handler.wfile.flush()
+
+        # With `n`, the choices' chunks are interleaved, as the API does
+        time.sleep(latency / 3)
+        chunked = []
+        for text in texts:
+            words = text.split(" ")
+            per_chunk = max(len(words) // self.stream_chunks, 1)
+            chunked.append([" ".join(words[start:start + per_chunk]) + " " for start in range(0, len(words), per_chunk)])
+        rounds = max(len(chunks) for chunks in chunked)
+        for position in range(rounds):
+            for index, chunks in enumerate(chunked):
+                if position < len(chunks):
+                    write_event(json.dumps({"choices": [{"index": index, "delta": {"content": chunks[position]}, "finish_reason": None}]}))
+            time.sleep(latency * 2 / 3 / rounds)
+        for index in range(len(texts)):
+            write_event(json.dumps({"choices": [{"index": index, "delta": {}, "finish_reason": "stop"}]}))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            write_event(json.dumps({"choices": [], "usage": usage}))
+        write_event("[DONE]")
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--chat-latency", default="lognormal:0.8,0.4", help="seconds per chat completion")
+    parser.add_argument("--image-latency", default="lognormal:6,0.3", help="seconds per image generation")
+    parser.add_argument("--cdn-latency", default="fixed:0.15", help="seconds until an image URL starts sending")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--image", help="image file to serve instead of a synthetic PNG")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    image_bytes = open(args.image, "rb").read() if args.image else None
+    server = MockOpenAIServer(
+        args.chat_latency, args.image_latency, args.cdn_latency, args.error_rate, args.throttle_rate,
+        args.retry_after, image_bytes, port=args.port, seed=args.seed
+    ).start()
+    print(f"Mock OpenAI API on {server.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
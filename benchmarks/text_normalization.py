@@ -0,0 +1,133 @@
+"""
+Text normalization: throughput of normalize_text and StreamNormalizer
+
+Every topic, persona, tone, generated post and style guide goes through
+normalize_text, and streamed posts through StreamNormalizer chunk by chunk.
+For inputs of the given size this measures, in MB/s of UTF-8:
+
+- ascii: plain ASCII text (most prompts and inputs)
+- realistic: a post with curly quotes, dashes, emoji, flags and accents
+- dense: nothing but characters that are mapped or removed (the worst case)
+- stream: the realistic text fed in small chunks, as a streamed response
+
+next to the sanitize_text the app used before (chained str.replace calls and a
+regex turning every other non-ASCII run into a space), and checks that the
+joined stream output equals normalize_text of the whole text, also with
+emoji sequences and surrogate pairs split across chunks.
+
+Usage:
+    python benchmarks/text_normalization.py [--size-kb 256] [--runs 5] [--chunk 8]
+"""
+
+import os
+import re
+import sys
+import random
+import argparse
+import statistics
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_normalize import StreamNormalizer, normalize_text  # noqa: E402
+
+ASCII_SAMPLE = "AI in healthcare - what changes for patients and doctors. It's not hype... "
+REALISTIC_SAMPLE = (
+    "\u201cAI won\u2019t replace doctors\u201d \u2014 but doctors using AI will \U0001f469\U0001f3fd\u200d\u2695\ufe0f. "
+    "Caf\u00e9 talk\u2026 \U0001f1e9\U0001f1ea \U0001f1eb\U0001f1f7 r\u00e9sum\u00e9s \U0001f44d\U0001f3fb\n"
+)
+DENSE_SAMPLE = "\u2019\u201c\u201d\u2013\u2014\u2026\u00a0\u200b\u00ad\ufeff"
+# Texts the stream check splits at every position
+EDGE_CASES = [
+    "\U0001f468\u200d\U0001f469\u200d\U0001f467\u200d\U0001f466 family",
+    "flags \U0001f1e9\U0001f1ea\U0001f1eb\U0001f1f7\U0001f1ee",
+    "e\u0301\u0301 \U0001f44d\U0001f3fd \u2764\ufe0f \U0001f3f4\U000e0067\U000e0062\U000e0065\U000e006e\U000e0067\U000e007f",
+    "\u201cquote\u201d \u2014 \U0001f44d split \ud83d\udc4d pair, lone \ud83d",
+    "crlf\r\nline\u2028sep\u00ad",
+    "lone low \udc4d",
+    "\udc4d",
+]
+
+
+# The app's sanitize_text before text_normalize, as the baseline
+def legacy_sanitize(text):
+    if text is None:
+        return ""
+    text = text.replace('\u2019', "'")
+    text = text.replace('\u2018', "'")
+    text = text.replace('\u201c', '"')
+    text = text.replace('\u201d', '"')
+    text = text.replace('\u2013', '-')
+    text = text.replace('\u2014', '--')
+    text = text.replace('\u2026', '...')
+    return re.sub(r'[^\x00-\x7F]+', ' ', text)
+
+
+def repeat_to(sample, size):
+    return (sample * (size // len(sample.encode("utf-8")) + 1))[:size]
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def stream(text_chunks):
+    normalizer = StreamNormalizer()
+    return "".join(normalizer.feed(chunk) for chunk in text_chunks) + normalizer.flush()
+
+
+# Median MB/s of `function(argument)` over `runs`, for `size` bytes of input
+def throughput(function, argument, size, runs):
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function(argument)
+        seconds.append(time.perf_counter() - started)
+    return size / statistics.median(seconds) / 1e6
+
+
+# Stream every edge case split at each position and in random chunks of the realistic text
+def check_stream(realistic):
+    for text in EDGE_CASES:
+        expected = normalize_text(text)
+        for cut in range(len(text) + 1):
+            assert stream([text[:cut], text[cut:]]) == expected, (text, cut)
+    rng = random.Random(0)
+    text = realistic[:20000]
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(1, len(text)), 2000))
+        parts = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        assert stream(parts) == normalize_text(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--chunk", type=int, default=8, help="characters per streamed chunk")
+    args = parser.parse_args()
+
+    size = args.size_kb * 1024
+    texts = {
+        "ascii": repeat_to(ASCII_SAMPLE, size),
+        "realistic": repeat_to(REALISTIC_SAMPLE, size),
+        "dense": repeat_to(DENSE_SAMPLE, size),
+    }
+    check_stream(texts["realistic"])
+    print(f"stream output matches normalize_text ({len(EDGE_CASES)} edge cases, 20 random splits)")
+
+    for name, text in texts.items():
+        encoded = len(text.encode("utf-8"))
+        print(
+            f"{name:<10} normalize_text {throughput(normalize_text, text, encoded, args.runs):8.1f} MB/s, "
+            f"old sanitize_text {throughput(legacy_sanitize, text, encoded, args.runs):8.1f} MB/s"
+        )
+    realistic = texts["realistic"]
+    print(
+        f"{'stream':<10} StreamNormalizer {throughput(stream, chunks(realistic, args.chunk), len(realistic.encode('utf-8')), args.runs):6.1f} MB/s"
+        f" ({args.chunk}-character chunks)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Record and replay of the HTTP traffic to the OpenAI API
+
+In record mode every request made through OpenAITransport (chat completions,
+streams, image generations and image downloads) is passed to the network and
+its response is written to a cassette file: status, headers and the body as
+it arrived, chunk by chunk with the time of each chunk, image bytes included.
+In replay mode the responses are served from the cassette without touching
+the network, optionally with the original timing (time to headers, gaps
+between stream chunks), so runs are deterministic and work offline.
+
+A cassette is a JSONL file, one request/response pair per line. Requests are
+matched on method, URL path and body; the API key is never recorded.
+"""
+
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+# Cassette file and mode ("record", "replay" or "" for neither); with OPENAI_CASSETTE_TIMING=1
+# replayed responses take as long as the recorded ones did
+CASSETTE_PATH = os.environ.get("OPENAI_CASSETTE", "")
+CASSETTE_MODE = os.environ.get("OPENAI_CASSETTE_MODE", "replay" if CASSETTE_PATH else "")
+CASSETTE_TIMING = os.environ.get("OPENAI_CASSETTE_TIMING", "0") == "1"
+
+# Response headers that describe the encoding on the wire; cassettes hold the decoded body
+_WIRE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request the cassette has no response for"""
+
+
+def request_match_key(method, url, body):
+    parts = urlsplit(url)
+    path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha256(f"{method} {path}\n".encode() + (body or b"")).hexdigest()
+
+
+def _encode_chunk(chunk):
+    try:
+        return {"text": chunk.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(chunk).decode("ascii")}
+
+
+def _decode_chunk(chunk):
+    return chunk["text"].encode("utf-8") if "text" in chunk else base64.b64decode(chunk["b64"])
+
+
+class Cassette:
+    """Thread-safe JSONL file of recorded request/response pairs"""
+
+    def __init__(self, path, mode):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._responses = {}  # match key -> recorded responses, in order
+        self._served = {}  # match key -> responses served so far
+
+        if mode == "record":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            open(path, "w").close()
+        else:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses.setdefault(entry["key"], []).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._responses.values())
+
+    def append(self, entry):
+        with self._lock:
+            self._responses.setdefault(entry["key"], []).append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    # The next recorded response for a request: repeats (e.g. a 429 and its retry) are served
+    # in recorded order, and the last one keeps being served once they run out
+    def next_response(self, key):
+        with self._lock:
+            entries = self._responses.get(key)
+            if not entries:
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            return entries[min(served, len(entries) - 1)]
+
+
+class _RecordingBody:
+    """Response body that records the chunks read through it and saves the pair once it is consumed"""
+
+    def __init__(self, raw, started, on_done):
+        self._raw = raw
+        self._started = started
+        self._on_done = on_done
+        self._chunks = []
+        self._done = False
+
+    def _add(self, chunk):
+        if chunk:
+            self._chunks.append([round(time.perf_counter() - self._started, 4), _encode_chunk(chunk)])
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._on_done(self._chunks)
+
+    def stream(self, amt=None, decode_content=True):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._add(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt=None, decode_content=True, **kwargs):
+        chunk = self._raw.read(amt, decode_content=decode_content, **kwargs)
+        self._add(chunk)
+        if not chunk or amt is None:
+            self._finish()
+        return chunk
+
+    def close(self):
+        # A response closed unread (e.g. a 429 before its retry) is still recorded whole
+        if not self._done:
+            self._add(self._raw.read(decode_content=True))
+            self._finish()
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class _ReplayBody:
+    """Response body serving recorded chunks, optionally at their recorded times"""
+
+    def __init__(self, chunks, started, timing):
+        self._chunks = chunks
+        self._started = started
+        self._timing = timing
+        self._position = 0
+
+    def _next_chunk(self):
+        at, chunk = self._chunks[self._position]
+        self._position += 1
+        if self._timing:
+            delay = at - (time.perf_counter() - self._started)
+            if delay > 0:
+                time.sleep(delay)
+        return _decode_chunk(chunk)
+
+    def stream(self, amt=None, decode_content=True):
+        while self._position < len(self._chunks):
+            yield self._next_chunk()
+
+    def read(self, amt=None, decode_content=True, **kwargs):
+        if amt is None:
+            return b"".join(self.stream())
+        return self._next_chunk() if self._position < len(self._chunks) else b""
+
+    def close(self):
+        self._position = len(self._chunks)
+
+    def release_conn(self):
+        pass
+
+
+class CassetteAdapter:
+    """requests transport adapter that records the responses of `inner` to a cassette, or replays them"""
+
+    def __init__(self, cassette, inner=None, timing=CASSETTE_TIMING):
+        self.cassette = cassette
+        self.inner = inner
+        self.timing = timing
+
+    def send(self, request, **kwargs):
+        key = request_match_key(request.method, request.url, request.body)
+        started = time.perf_counter()
+        if self.cassette.mode == "replay":
+            return self._replay(request, key, started)
+
+        response = self.inner.send(request, **kwargs)
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in _WIRE_HEADERS}
+        elapsed = round(time.perf_counter() - started, 4)
+
+        def save(chunks):
+            self.cassette.append({
+                "key": key,
+                "method": request.method,
+                "url": request.url,
+                "request": json.loads(request.body) if request.body else None,
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": headers,
+                "elapsed": elapsed,
+                "chunks": chunks,
+            })
+
+        response.raw = _RecordingBody(response.raw, started, save)
+        return response
+
+    def _replay(self, request, key, started):
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        entry = self.cassette.next_response(key)
+        if entry is None:
+            raise CassetteMiss(f"No recorded response for {request.method} {request.url}")
+        if self.timing and entry["elapsed"] > 0:
+            time.sleep(entry["elapsed"])
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=entry["elapsed"])
+        response.raw = _ReplayBody(entry["chunks"], started, self.timing)
+        return response
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
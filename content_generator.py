@@ -1,347 +1,170 @@
+import sys
+
+# `python -m content_generator batch topics.csv` runs without the UI: it is dispatched before
+# Streamlit (and the component static_assets declares on import) is loaded
+if __name__ == "__main__" and sys.argv[1:2] == ["batch"]:
+    from batch import main as batch_main
+    sys.exit(batch_main(sys.argv[2:]))
+
 import streamlit as st
-import openai
-import requests
-import io
-import base64
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import os
-import re
-import json
-from PIL import Image
 from datetime import datetime
-import html
+from contextlib import nullcontext
+
+from openai_transport import OpenAITransport
+from response_cache import ResponseCache
+from artifact_store import ArtifactStore, MIME_TYPES
+from prompt_registry import PROMPTS, exact_token_counts
+from generation import ARTIFACTS, PLATFORM_LABELS, ContentGenerator, ContentRequest, StyleGuideCache
+from text_normalize import normalize_text
+from usage_ledger import UsageHistory, preflight_estimate
+from tracing import graft, span, trace
+from jobs import JobQueue
+from static_assets import copy_button, inject_styles
 
-# Prevent OpenAI from trying to use system proxies
+# Prevent the HTTP client from trying to use system proxies
 os.environ['NO_PROXY'] = '*'
 
 # Disable requests SSL verification if needed
 # requests.packages.urllib3.disable_warnings()
 # os.environ['PYTHONHTTPSVERIFY'] = '0'
 
-# Global variable for LinkedIn style guide consistency
-linkedin_style_guide = ""
+# Seconds between polls of a running job
+JOB_POLL_SECONDS = 0.5
 
-# Page configuration
-st.set_page_config(
-    page_title="AI Content Generator v2.0",
-    page_icon="✨",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Everything one "Generate Content" run produces, with what to show while it is pending
+PENDING_MESSAGES = {
+    "linkedin_text": "⏳ Writing LinkedIn post...",
+    "linkedin_slide_1": "⏳ Creating slide 1...",
+    "linkedin_slide_2": "⏳ Creating slide 2...",
+    "linkedin_slide_3": "⏳ Creating slide 3...",
+    "twitter_text": "⏳ Writing tweet...",
+    "twitter_image": "⏳ Creating Twitter image...",
+    "whatsapp_image": "⏳ Creating WhatsApp image...",
+    "whatsapp_text": "⏳ Writing WhatsApp message...",
+}
 
-# App styling
-st.markdown("""
-<style>
-    /* Import Poppins font from Google Fonts */
-    @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap');
-    
-    /* Set Poppins as the default font for everything */
-    html, body, [class*="css"], p, h1, h2, h3, h4, h5, h6, button, input, textarea, .stMarkdown, .stText, div {
-        font-family: 'Poppins', sans-serif !important;
-    }
-    
-    .app-header {
-        text-align: center;
-        padding: 1.5rem 0;
-        border-bottom: 1px solid #f0f2f5;
-        margin-bottom: 2rem;
-    }
-    .app-header h1 {
-        color: #1E3A8A;
-        font-size: 2.5rem;
-        margin-bottom: 0.5rem;
-    }
-    .app-header p {
-        color: #4B5563;
-        font-size: 1.1rem;
-    }
-    .content-card {
-        background: white;
-        padding: 1.5rem;
-        border-radius: 0.5rem;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-        margin-bottom: 1.5rem;
-    }
-    .platform-header {
-        font-size: 1.3rem;
-        color: #1E3A8A;
-        margin-bottom: 1rem;
-        padding-bottom: 0.5rem;
-        border-bottom: 1px solid #E5E7EB;
-    }
-    .platform-icon {
-        margin-right: 0.5rem;
-        vertical-align: middle;
-    }
-    .content-display {
-        background: #F9FAFB;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-        border-left: 4px solid #1E3A8A;
-    }
-    .action-button {
-        background-color: #1E3A8A;
-        color: white;
-        border: none;
-        padding: 0.5rem 1rem;
-        border-radius: 0.25rem;
-        cursor: pointer;
-        font-weight: 500;
-        transition: background-color 0.2s;
-    }
-    .action-button:hover {
-        background-color: #1E40AF;
-    }
-    .copy-btn {
-        background-color: #10B981;
-        color: white;
-        border: none;
-        padding: 0.5rem 1rem;
-        border-radius: 0.25rem;
-        cursor: pointer;
-        font-size: 0.9rem;
-        margin-top: 0.5rem;
-        transition: all 0.2s ease;
-        font-weight: 500;
-    }
-    .copy-btn:hover {
-        background-color: #059669;
-        transform: translateY(-1px);
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-    }
-    .copy-btn:active {
-        transform: translateY(0);
-        box-shadow: none;
-    }
-    .hidden-content {
-        display: none;
-        visibility: hidden;
-        position: absolute;
-        left: -9999px;
-    }
-    .whatsapp-message {
-        background-color: #DCF8C6;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-    }
-    .linkedin-message {
-        background-color: #E7F3FF;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-    }
-    .twitter-message {
-        background-color: #F0F5FF;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-    }
-    .required-field::after {
-        content: " *";
-        color: red;
-    }
-    .stButton > button {
-        width: 100%;
-        background-color: #1E3A8A;
-        color: white;
-        padding: 0.75rem 0;
-        font-size: 1.1rem;
-        font-weight: 500;
-    }
-    .stButton > button:hover {
-        background-color: #1E40AF;
-    }
-    .step-number {
-        display: inline-block;
-        width: 30px;
-        height: 30px;
-        border-radius: 50%;
-        background-color: #1E3A8A;
-        color: white;
-        text-align: center;
-        line-height: 30px;
-        margin-right: 10px;
-    }
-    div[data-testid="stSidebar"] > div:first-child {
-        background-color: #F8FAFC;
-    }
-    .api-notice {
-        font-size: 0.8rem;
-        font-style: italic;
-        color: #6B7280;
-        margin-top: 0.25rem;
-    }
-</style>
+# Artifacts that are generated together (Twitter and WhatsApp share one image)
+REGENERATION_GROUPS = {
+    "twitter_image": ["twitter_image", "whatsapp_image"],
+    "whatsapp_image": ["twitter_image", "whatsapp_image"],
+}
+REGENERATION_HELP = {
+    "linkedin_slide_1": "Generate a new version of this slide in the carousel's existing style",
+    "linkedin_slide_2": "Generate a new version of this slide in the carousel's existing style",
+    "linkedin_slide_3": "Generate a new version of this slide in the carousel's existing style",
+    "twitter_image": "Generate a new image (shared by the Twitter and WhatsApp tabs)",
+    "whatsapp_image": "Generate a new image (shared by the Twitter and WhatsApp tabs)",
+}
 
-<!-- Clipboard JS functionality -->
-<script>
-document.addEventListener('DOMContentLoaded', function() {
-    console.log('DOM fully loaded, initializing copy buttons');
-    
-    // Function to handle the actual copy operation
-    function copyTextToClipboard(text, button) {
-        console.log('Attempting to copy text: ', text.substring(0, 30) + '...');
-        
-        // Try using the modern Clipboard API first
-        if (navigator.clipboard && navigator.clipboard.writeText) {
-            navigator.clipboard.writeText(text)
-                .then(() => {
-                    console.log('Copy successful with Clipboard API');
-                    updateButtonFeedback(button, true);
-                })
-                .catch(err => {
-                    console.error('Clipboard API error: ', err);
-                    // Fall back to execCommand method
-                    fallbackCopyMethod(text, button);
-                });
-        } else {
-            console.log('Clipboard API not available, using fallback');
-            fallbackCopyMethod(text, button);
-        }
-    }
-    
-    // Fallback copy method using execCommand
-    function fallbackCopyMethod(text, button) {
-        try {
-            const textarea = document.createElement('textarea');
-            textarea.value = text;
-            
-            // Make the textarea invisible but keep it in the document flow
-            textarea.style.position = 'fixed';
-            textarea.style.opacity = 0;
-            textarea.style.pointerEvents = 'none';
-            textarea.style.left = '0';
-            textarea.style.top = '0';
-            
-            document.body.appendChild(textarea);
-            textarea.focus();
-            textarea.select();
-            
-            const successful = document.execCommand('copy');
-            document.body.removeChild(textarea);
-            
-            if (successful) {
-                console.log('Fallback copy method succeeded');
-                updateButtonFeedback(button, true);
-            } else {
-                console.log('Fallback copy method failed');
-                updateButtonFeedback(button, false);
-            }
-        } catch (err) {
-            console.error('Fallback copy error: ', err);
-            updateButtonFeedback(button, false);
-        }
-    }
-    
-    // Update button to provide user feedback
-    function updateButtonFeedback(button, success) {
-        const originalText = button.textContent || button.innerText;
-        
-        if (success) {
-            button.innerText = 'Copied!';
-            button.style.backgroundColor = '#059669';
-        } else {
-            button.innerText = 'Copy failed';
-            button.style.backgroundColor = '#DC2626';
+# Table rows of a usage summary, one per platform
+def usage_rows(usage):
+    return [
+        {
+            "Platform": label,
+            "Prompt": usage[platform]["prompt_tokens"],
+            "Cached": usage[platform]["cached_tokens"],
+            "Completion": usage[platform]["completion_tokens"],
+            "Images": usage[platform]["images"],
+            "Cost ($)": round(usage[platform]["cost"], 4),
         }
-        
-        setTimeout(() => {
-            button.innerText = originalText;
-            button.style.backgroundColor = '';
-        }, 2000);
-    }
+        for platform, label in PLATFORM_LABELS.items() if platform in usage
+    ]
+
+# Waterfall chart of the spans of a traced run, one bar per span in start order
+def render_trace(metadata):
+    spans = metadata["trace"] + metadata.get("render_trace", [])
+    by_id = {record["span_id"]: record for record in spans}
     
-    // Add global click event listener for copy buttons
-    document.body.addEventListener('click', function(event) {
-        // Find if the clicked element or any of its parents is a copy button
-        let target = event.target;
-        while (target && !target.classList.contains('copy-btn')) {
-            target = target.parentElement;
-        }
+    rows = []
+    for index, record in enumerate(spans):
+        # Depth in the tree, and the run-level task (e.g. "linkedin_slide_2") the span belongs to
+        depth = 0
+        task = record["name"]
+        parent = by_id.get(record["parent_id"])
+        while parent is not None:
+            depth += 1
+            if parent["parent_id"] is not None:
+                task = parent["name"]
+            parent = by_id.get(parent["parent_id"])
         
-        // If we found a copy button
-        if (target && target.classList.contains('copy-btn')) {
-            event.preventDefault();
-            
-            console.log('Copy button clicked');
-            const contentId = target.getAttribute('data-content-id');
-            console.log('Looking for content with ID:', contentId);
-            
-            if (!contentId) {
-                console.error('No content ID found on button');
-                updateButtonFeedback(target, false);
-                return;
-            }
-            
-            const contentElement = document.getElementById(contentId);
-            
-            if (!contentElement) {
-                console.error('Content element not found with ID:', contentId);
-                updateButtonFeedback(target, false);
-                return;
-            }
-            
-            const textToCopy = contentElement.innerText || contentElement.textContent;
-            
-            if (!textToCopy || textToCopy.trim() === '') {
-                console.error('No text content found to copy');
-                updateButtonFeedback(target, false);
-                return;
-            }
-            
-            copyTextToClipboard(textToCopy, target);
-        }
-    });
+        rows.append({
+            "span": f"{index:02d} {'  ' * depth}{record['name']}",
+            "task": task,
+            "start_ms": round(record["offset"] * 1000, 1),
+            "end_ms": round((record["offset"] + record["duration"]) * 1000, 1),
+            "duration_ms": round(record["duration"] * 1000, 1),
+            "thread": record["thread"],
+            "error": record.get("error", ""),
+        })
     
-    console.log('Copy button initialization complete');
-});
+    with st.expander("🕒 Trace timeline", expanded=True):
+        st.vega_lite_chart(rows, {
+            "mark": {"type": "bar", "cornerRadius": 2},
+            "height": max(len(rows) * 16, 120),
+            "encoding": {
+                "y": {"field": "span", "type": "nominal", "sort": None, "axis": {"title": None, "labelLimit": 320}},
+                "x": {"field": "start_ms", "type": "quantitative", "title": "ms since the run started"},
+                "x2": {"field": "end_ms"},
+                "color": {"field": "task", "type": "nominal", "legend": {"title": None}},
+                "tooltip": [
+                    {"field": "span"}, {"field": "duration_ms"}, {"field": "start_ms"},
+                    {"field": "thread"}, {"field": "error"}
+                ],
+            },
+        }, use_container_width=True)
+        st.caption(f"Trace written to {metadata['trace_file']}")
 
-// Add this to ensure the script runs even if Streamlit reruns the app
-if (window.frameElement) {
-    // We're in an iframe
-    setTimeout(() => {
-        console.log('Delayed clipboard initialization for iframe');
-        const event = new Event('DOMContentLoaded');
-        document.dispatchEvent(event);
-    }, 1000);
-}
-</script>
+# Page configuration and app styling (Streamlit allows set_page_config only as the first call)
+def setup_page():
+    st.set_page_config(
+        page_title="AI Content Generator v2.0",
+        page_icon="✨",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
 
-<script>
-// This second script handles the case where Streamlit's iframe might be reloaded
-window.addEventListener('load', function() {
-    setTimeout(() => {
-        const copyButtons = document.querySelectorAll('.copy-btn');
-        if (copyButtons.length > 0) {
-            console.log('Found', copyButtons.length, 'copy buttons after page load');
-            const event = new Event('DOMContentLoaded');
-            document.dispatchEvent(event);
-        }
-    }, 1500);
-});
-</script>
-""", unsafe_allow_html=True)
+    # App styling, served as a cached stylesheet (see static_assets.py)
+    inject_styles()
 
-# Function to sanitize text for safe display and processing
-def sanitize_text(text):
-    if text is None:
-        return ""
-    # Replace problematic Unicode characters with ASCII equivalents
-    text = text.replace('\u2019', "'")  # Right single quotation mark
-    text = text.replace('\u2018', "'")  # Left single quotation mark
-    text = text.replace('\u201C', '"')  # Left double quotation mark
-    text = text.replace('\u201D', '"')  # Right double quotation mark
-    text = text.replace('\u2013', '-')  # En dash
-    text = text.replace('\u2014', '--')  # Em dash
-    text = text.replace('\u2026', '...')  # Ellipsis
-    
-    # Remove any remaining non-ASCII characters
-    text = re.sub(r'[^\x00-\x7F]+', ' ', text)
-    
-    return text
+# One pooled keep-alive HTTP transport for the whole server process, shared by all
+# sessions and reruns (Streamlit keeps cache_resource objects alive between runs)
+@st.cache_resource
+def get_openai_transport():
+    return OpenAITransport()
+
+# On-disk chat response cache, opened once per server process
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+# On-disk store of generated images, shared by all sessions
+@st.cache_resource
+def get_image_store():
+    return ArtifactStore()
+
+# Per-run usage log, shared by all sessions
+@st.cache_resource
+def get_usage_history():
+    return UsageHistory()
+
+# Background generation jobs of all sessions, so a run outlives the script run that started it
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+# LinkedIn carousel style guides of all sessions, keyed by session so concurrent users
+# never share one
+@st.cache_resource
+def get_style_guide_cache():
+    return StyleGuideCache()
 
 def main():
+    setup_page()
+    transport = get_openai_transport()
+    image_store = get_image_store()
+    
     # App header
     st.markdown('<div class="app-header">', unsafe_allow_html=True)
     st.markdown('<h1>✨ AI Content Generator v2.0</h1>', unsafe_allow_html=True)
@@ -386,6 +209,55 @@ def main():
             index=0,
             horizontal=True
         )
+        
+        st.markdown("---")
+        
+        st.subheader("✍️ Text")
+        text_variants = st.select_slider(
+            "Versions of each post",
+            options=[1, 2, 3, 4],
+            value=1,
+            help="Ask for several versions of each post in one request, so the prompt is paid for once, and show them side by side, ranked best first"
+        )
+        
+        st.markdown("---")
+        
+        st.subheader("⚡ Performance")
+        stream_text = st.checkbox(
+            "Stream text as it's written",
+            value=True,
+            help="Show the posts token by token instead of waiting for each complete response"
+        )
+        
+        show_trace = st.checkbox(
+            "Show trace timeline",
+            value=False,
+            help="Chart where the time of the last generation went, stage by stage"
+        )
+        
+        # Persistent caches for text responses and generated images
+        use_response_cache = st.checkbox(
+            "Reuse cached text responses",
+            value=False,
+            help="Serve regenerations with an unchanged topic, persona, tone and platform from a local cache instead of paying for them again"
+        )
+        fresh_variation = st.toggle(
+            "Fresh variation",
+            value=False,
+            help="Bypass the caches and ask for a new take (the text prompts sample at temperature 1.0, and identical image requests are otherwise served from the image store)"
+        )
+        cache_stats_placeholder = st.empty()
+        
+        st.markdown("---")
+        
+        st.subheader("💰 Usage & cost")
+        usage_placeholder = st.empty()
+    
+    response_cache = get_response_cache() if use_response_cache else None
+    generator = ContentGenerator(
+        api_key, transport, image_store, response_cache, image_style, image_quality,
+        style_guides=get_style_guide_cache(), session_id=get_script_run_ctx().session_id
+    )
 
     # Main content area - Input section
     st.header("Step 1: Define your content")
@@ -415,12 +287,7 @@ def main():
     persona_col1, persona_col2 = st.columns(2)
     
     with persona_col1:
-        persona_options = {
-            "Ogilvy-style storyteller": "Creative mastermind, engaging, cult-like following",
-            "Data-Driven Strategist": "Insightful, fact-based, analytical",
-            "Tech Visionary": "Futuristic, innovative, cutting-edge",
-            "Savage Satirist": "Witty, sharp, no-BS takes"
-        }
+        persona_options = {name: style.get("summary", "") for name, style in PROMPTS.personas.items()}
         
         persona = st.radio(
             "Select a persona",
@@ -447,11 +314,7 @@ def main():
     tone_col1, tone_col2 = st.columns(2)
     
     with tone_col1:
-        tone_options = {
-            "Sarcastic": "Sharp, witty, cutting humor",
-            "Professional": "Insightful, polished, credible",
-            "Casual": "Conversational, engaging, easygoing"
-        }
+        tone_options = {name: style.get("summary", "") for name, style in PROMPTS.tones.items()}
         
         tone = st.radio(
             "Select a tone",
@@ -469,663 +332,360 @@ def main():
     if not api_key:
         st.warning("⚠️ Please enter your OpenAI API key in the sidebar", icon="⚠️")
     
-    # Content generation functions
-    def generate_text_content(topic, persona, tone, platform):
-        if not api_key:
-            st.error("OpenAI API key is required to generate content")
-            return None
+    # Render a generated post (with its copy button, unless `controls` is off) into a placeholder
+    def render_text_content(placeholder, platform, content, controls=True):
+        with placeholder.container():
+            st.markdown(f'<div class="{platform}-message">', unsafe_allow_html=True)
+            st.markdown(content)
+            st.markdown('</div>', unsafe_allow_html=True)
+            if controls:
+                copy_button(content, key=f"copy_{platform}")
+    
+    # Render the versions of a post side by side, in the engine's order: checked and ranked,
+    # best first
+    def render_text_variants(placeholder, platform, variants, controls=True):
+        with placeholder.container():
+            for i, (col, content) in enumerate(zip(st.columns(len(variants)), variants)):
+                with col:
+                    st.caption("Best match" if i == 0 else f"Version {i + 1}")
+                    st.markdown(f'<div class="{platform}-message">', unsafe_allow_html=True)
+                    st.markdown(content)
+                    st.markdown('</div>', unsafe_allow_html=True)
+                    if controls:
+                        copy_button(content, key=f"copy_{platform}_{i}")
+    
+    # Render a stored image into a placeholder: a downscaled preview, and (unless `controls` is
+    # off) a download button that serves the original bytes only when clicked
+    def render_image(placeholder, image_path, filename, button_text, key, controls=True):
+        with placeholder.container():
+            with span("thumbnail"):
+                thumbnail_path = image_store.thumbnail_path(image_path)
+            st.image(thumbnail_path, use_container_width=True)
+            if not controls:
+                return
+            with open(image_path, "rb") as f:
+                st.download_button(
+                    button_text,
+                    data=f.read(),
+                    file_name=filename,
+                    mime=MIME_TYPES[os.path.splitext(image_path)[1]],
+                    key=key,
+                    on_click="ignore"
+                )
+    
+    # Regenerate controls only record the request; the rerun they trigger does the work
+    def request_regeneration(artifacts):
+        st.session_state["regenerate"] = artifacts
+    
+    # Render one artifact of the session's result model into its placeholder. While a job runs
+    # the page is re-rendered on every poll, so the copy and download buttons (which re-read
+    # and re-send the original image) wait until it has finished
+    def render_artifact(placeholder, artifact, entry, generating=False, can_regenerate=True):
+        controls = not generating
+        if entry is None:
+            if generating:
+                placeholder.markdown(PENDING_MESSAGES[artifact])
+            else:
+                placeholder.info("Generation stopped before this was ready. Click Generate Content to finish it.")
+            return
         
-        # Sanitize inputs before sending to API
-        sanitized_topic = sanitize_text(topic)
-        sanitized_persona = sanitize_text(persona)
-        sanitized_tone = sanitize_text(tone)
+        with placeholder.container():
+            if "error" in entry:
+                st.error(entry["error"])
+            elif "variants" in entry:
+                render_text_variants(st.empty(), artifact[:-len("_text")], entry["variants"], controls)
+            elif "text" in entry:
+                if entry["text"]:
+                    render_text_content(st.empty(), artifact[:-len("_text")], entry["text"], controls)
+            elif not os.path.exists(entry["image_path"]):
+                st.warning("This image is no longer in the local image store. Regenerate it to recreate it.")
+            elif artifact.startswith("linkedin_slide_"):
+                slide_number = artifact[-1]
+                render_image(st.empty(), entry["image_path"], f"linkedin_slide_{slide_number}.png", f"Download Slide {slide_number}", f"download_{artifact}", controls)
+            else:
+                render_image(st.empty(), entry["image_path"], f"{artifact}.png", "Download Image", f"download_{artifact}", controls)
+            
+            st.button(
+                "🔄 Regenerate",
+                key=f"regenerate_{artifact}",
+                on_click=request_regeneration,
+                args=(REGENERATION_GROUPS.get(artifact, [artifact]),),
+                disabled=not api_key or not can_regenerate,
+                help=REGENERATION_HELP.get(artifact, "Generate a new version of just this")
+                if can_regenerate else "The inputs changed since this was generated. Click Generate Content first."
+            )
+    
+    # Lay out the platform tabs with one placeholder per artifact
+    def create_result_layout():
+        # Create tabs for each platform
+        linkedin_tab, twitter_tab, whatsapp_tab = st.tabs(["LinkedIn", "Twitter", "WhatsApp"])
+        placeholders = {}
         
-        try:
-            # Direct API call without using the client object
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            # Define distinctive persona characteristics
-            persona_styles = {
-                "Ogilvy-style storyteller": {
-                    "voice": "captivating storyteller who uses vivid metaphors and emotional appeals",
-                    "structure": "narrative arc with a hook, challenge, resolution, and call to action",
-                    "signature": "draws powerful analogies and uses sensory language",
-                    "examples": ["Once upon a time...", "Picture this:", "Here's the truth nobody's talking about:", "The secret most people miss:"],
-                    "data_use": "weaves statistics into compelling narratives, using them as plot points, not the main focus"
-                },
-                "Data-Driven Strategist": {
-                    "voice": "analytical expert who breaks down complex trends with razor-sharp precision",
-                    "structure": "thesis, evidence, implications, tactical recommendations",
-                    "signature": "uses data to challenge assumptions, references research and case studies",
-                    "examples": ["The data reveals something surprising:", "According to new research:", "Three critical insights from the numbers:", "Here's what most analysis gets wrong:"],
-                    "data_use": "leads with statistics, contextualizes numbers, compares trends, focuses on implications"
-                },
-                "Tech Visionary": {
-                    "voice": "forward-thinking innovator who sees around corners and challenges conventional thinking",
-                    "structure": "bold prediction, supporting signals, implications, call for preparation",
-                    "signature": "uses provocative questions, contrasts past/future, speaks in definitive declarations",
-                    "examples": ["The next revolution isn't what you think.", "Forget everything you know about [topic].", "By 2025, we won't even recognize today's [topic].", "The future belongs to those who..."],
-                    "data_use": "references cutting-edge research, early signals, adoption curves, and emerging trends"
-                },
-                "Savage Satirist": {
-                    "voice": "brutally honest commentator who uses humor and irreverence to cut through BS",
-                    "structure": "setup, unexpected punchline, sharp observation, counterintuitive take",
-                    "signature": "uses rhetorical questions, cultural references, exaggeration for effect",
-                    "examples": ["Let's be honest -", "Hot take:", "Unpopular opinion:", "Am I the only one who thinks...", "The uncomfortable truth about [topic]:"],
-                    "data_use": "uses statistics selectively to punctuate arguments or debunk myths, often followed by satirical commentary"
-                }
-            }
-            
-            # Define distinctive tone characteristics
-            tone_styles = {
-                "Sarcastic": {
-                    "language": "biting, irreverent, using hyperbole and unexpected twists",
-                    "structure": "setup-subversion pattern, where expectations are established then deliberately broken",
-                    "examples": ["Oh great, another [topic] expert with all the answers...", "Shocking news: [counterintuitive statement]", "In today's episode of 'Things Nobody Asked For'..."],
-                    "punctuation": "..., ?!, *, (eye roll)"
-                },
-                "Professional": {
-                    "language": "clear, articulate, measured, with industry terminology used naturally",
-                    "structure": "logical flow with clear transitions and balanced perspective",
-                    "examples": ["A critical consideration for professionals:", "Three key implications for the industry:", "What leading organizations are discovering:"],
-                    "punctuation": ". , : ; —"
-                },
-                "Casual": {
-                    "language": "conversational, using contractions, colloquialisms, and friendly asides",
-                    "structure": "informal, with tangents, personal reflections, and direct reader address",
-                    "examples": ["So I've been thinking about [topic] lately...", "OK, hear me out on this one:", "You know that feeling when..."],
-                    "punctuation": "..., !, &, +"
-                }
-            }
-            
-            # Get the selected persona style, or use a default if custom persona
-            selected_persona = persona_styles.get(sanitized_persona, {
-                "voice": f"{sanitized_persona}",
-                "structure": "tailored to the subject with distinctive viewpoint",
-                "signature": "uses specialized language and perspectives specific to their expertise",
-                "examples": ["From my perspective:", "Here's what I've observed:", "My take on this:"],
-                "data_use": "uses data selectively to support key points when relevant"
-            })
-            
-            # Get the selected tone style
-            selected_tone = tone_styles.get(sanitized_tone, tone_styles["Professional"])
-            
-            # Common content guidelines with more flexibility
-            content_guidelines = f"""
-            CRITICAL CONTENT REQUIREMENTS:
+        # LinkedIn Content
+        with linkedin_tab:
+            st.markdown('<div class="content-card">', unsafe_allow_html=True)
+            st.markdown('<h3 class="platform-header"><span class="platform-icon">🔗</span> LinkedIn Post</h3>', unsafe_allow_html=True)
+            placeholders["linkedin_text"] = st.empty()
             
-            1. FOCUS ON REAL-WORLD TRENDS FOR THE EXACT TOPIC:
-               - Focus EXCLUSIVELY on "{sanitized_topic}" - never default to AI-related content unless the topic is about AI
-               - Research and reference real current trends, developments, and insights specific to this exact topic
-               - Avoid generic content - find specific, unique insights about this particular subject
-               - If the topic is an industry/field, focus on the latest developments, challenges, and innovations in that industry
-            
-            2. VOICE & PERSONALITY:
-               - Write exclusively as a {selected_persona["voice"]} with a {selected_tone["language"]} tone
-               - Use {selected_persona["signature"]}
-               - Structure content using {selected_persona["structure"]}
-               - NEVER use AI-sounding phrases like "Here's the scoop," "Let's dive in," "Here's the kicker," etc.
-               - Avoid formulaic transitions and obvious rhetorical devices
-            
-            3. ADAPT TO TOPIC TYPE INTELLIGENTLY:
-               - For leadership/personal topics: Use stories, experiences, and insights over data
-               - For trends/insights: Use {selected_persona["data_use"]} 
-               - For big ideas/future concepts: Be bold, provocative, and challenge assumptions
-               - For practical tips: Make content actionable with clear steps
-            
-            4. MAKE IT DISTINCTIVELY HUMAN:
-               - Write as if speaking to ONE person, never an audience
-               - Avoid generic corporate language, platitudes, and robot-like phrasing
-               - Include a personal angle - what YOU think, not what "people" think
-               - Be willing to take a clear position rather than being neutral on everything
-               - Add subtle human imperfections - occasional run-on sentences, short fragments, natural digressions
-               - Use varied sentence structure - not repetitive patterns that sound formulaic
-               - Keep sentences crisp and direct, with natural flow and rhythm
-               
-            5. FORMATTING & STYLE:
-               - Use {selected_tone["punctuation"]} in a way that feels natural to this voice
-               - Break ideas into digestible chunks with line breaks and emphasis
-               - Vary sentence length dramatically - mix very short sentences with occasional longer ones
-               - Add occasional personal asides or tangents
-               - Avoid unnecessary fillers and vague generalizations
-               - Speak directly to the reader, not at them
-               
-            6. END WITH IMPACT:
-               - Conclude with something memorable that reflects the specific persona and tone
-               - For {sanitized_persona}: end with something that showcases their unique perspective
-               - For {sanitized_tone} tone: use the appropriate closing style for this tone
-               - Add a personal touch that shows you're a real person with real opinions
-               - Avoid clichéd closing lines like "What do you think?" or "Let me know in the comments"
-            """
-            
-            if platform == "linkedin":
-                prompt = f"""
-                Create a distinctive LinkedIn post about "{sanitized_topic}" that absolutely could ONLY have been written by a {sanitized_persona} with a {sanitized_tone} tone.
-
-                {content_guidelines}
-                
-                KEY INSTRUCTIONS FOR CONTENT FORMAT:
-                
-                1. DEFINE THE CONTENT STYLE BASED ON THE TOPIC:
-                   - If "{sanitized_topic}" is personal or leadership-focused -> Use storytelling and real-life experiences
-                   - If "{sanitized_topic}" is trends or insights -> Use sharp takes, backed by data and examples
-                   - If "{sanitized_topic}" is a big idea or future concept -> Be thought-provoking, challenging norms
-                   - If "{sanitized_topic}" is a practical tip or framework -> Make it actionable with clear steps
-                
-                2. START WITH A HOOK (FIRST LINE MUST GRAB ATTENTION):
-                   - Use bold statements, a thought-provoking question, or an unexpected fact
-                   - Example: "Most people get networking wrong. It's not about collecting contacts. It's about earning trust."
-                
-                3. BREAK THE CONTENT INTO EASY-TO-READ CHUNKS:
-                   - Avoid long paragraphs—use short, punchy sentences and line breaks
-                   - Add sub-bullets when explaining a point to improve clarity
-                
-                4. MAKE IT SOUND HUMAN (NOT ROBOTIC OR AI-GENERATED):
-                   - Write as if you're speaking to one person, not an audience
-                   - Inject personality—use wit, emotion, and relatable language
-                   - Example: Instead of "Networking is essential for career growth" -> "The best opportunities don't come from job portals. They come from one unexpected conversation."
-                
-                5. ALWAYS PROVIDE A TAKEAWAY:
-                   - End with a strong insight, a challenge, or a call to action
-                   - Example: "If you don't have a personal brand yet, someone else will define your reputation for you. What's the one thing you want to be known for?"
-                
-                6. CONSIDER USING A STRONG CLOSING LINE FOR IMPACT:
-                   - "Food for thought."
-                   - "The game has changed. Have you?"
-                   - "Curious—what's your take?"
-                
-                PLATFORM-SPECIFIC GUIDANCE:
-                1. Length: 100-200 words 
-                2. Include data ONLY IF it fits the selected persona style ({selected_persona["data_use"]})
-                3. Structure the post with sufficient white space - never dense paragraphs
-                4. Include 1-2 relevant hashtags IF they fit the persona and tone (not forced)
-                
-                CRITICAL HUMANIZATION REQUIREMENTS:
-                1. Include at least one personal experience, opinion, or viewpoint that makes it feel like a real person wrote it
-                2. Start naturally - avoid overused AI phrases like "I'm excited to share," "Here's why," or "Let's talk about"
-                3. Include at least one conversational element (rhetorical question, casual aside, etc.) that feels natural
-                4. Make sure it doesn't sound overly polished or like marketing copy
-                5. Write with confidence and directness - no hedging or unnecessary qualifiers
-                
-                IMPORTANT: The personality distinction is CRITICAL. A reader should instantly recognize this as coming from a {sanitized_persona}, not a generic writer. Make the {sanitized_tone} tone unmistakable.
-                
-                AVOID LIKE THE PLAGUE:
-                - Clichéd phrases like "Here's the thing," "Let me tell you," "The key takeaway," etc.
-                - Obvious AI-generated patterns like "As a [profession], I believe..."
-                - Repetitive sentence structures that create a robotic rhythm
-                - Unnecessary transitions between ideas that feel mechanical
-                
-                Use only ASCII characters.
-                
-                FINAL REMINDER: Ensure your content focuses entirely on {sanitized_topic} and real trends in this field - do NOT default to AI-related content unless the topic is specifically about AI.
-                """
-                max_tokens = 350
+            # LinkedIn Reel (3 slides)
+            st.markdown('<h3 class="platform-header" style="margin-top: 2rem;"><span class="platform-icon">🎬</span> LinkedIn Reel Slides</h3>', unsafe_allow_html=True)
             
-            elif platform == "twitter":
-                prompt = f"""
-                Create a Twitter post about "{sanitized_topic}" that has the UNMISTAKABLE voice of a {sanitized_persona} with a {sanitized_tone} tone.
-                
-                {content_guidelines}
-                
-                PLATFORM-SPECIFIC GUIDANCE:
-                1. Length: Maximum 280 characters
-                2. Start with a POWERFUL HEADLINE that immediately grabs attention and invokes interest
-                3. Include a surprising insight that fits this specific persona's perspective
-                4. Include hashtags ONLY if they feel organic and authentic (max 1-2)
-                
-                CRITICAL HUMANIZATION REQUIREMENTS:
-                1. Make it sound like something typed quickly on a phone, never AI-generated or overly crafted
-                2. Include natural text elements without forcing in "IMO", "Tbh" - only if it fits the voice naturally
-                3. Avoid perfect sentence structures or overly sophisticated vocabulary
-                4. Create a post that sounds like it came from a real person with real opinions
-                
-                IMPORTANT: This MUST read like it came from a real person with a distinct personality - not a generic social media post. The {sanitized_persona} voice should be instantly recognizable.
-                
-                AVOID LIKE THE PLAGUE:
-                - Clichéd Twitter phrases like "Hot take:" or "Thread:"
-                - Obvious AI patterns like "As someone who..."
-                - Any hint of formulaic or template-based writing
-                
-                FINAL REMINDER: Ensure your content focuses entirely on {sanitized_topic} and real trends in this field - do NOT default to AI-related content unless the topic is specifically about AI.
-                """
-                max_tokens = 200
+            slide_cols = st.columns(3)
+            for i, col in enumerate(slide_cols):
+                with col:
+                    placeholders[f"linkedin_slide_{i+1}"] = st.empty()
             
-            elif platform == "whatsapp":
-                # Keep all the persona and tone customization but update the formatting instructions
-                prompt = f"""
-                Create a WhatsApp message about "{sanitized_topic}" that follows these specific formatting instructions for high engagement while embodying the personality of a {sanitized_persona} with a {sanitized_tone} tone.
-                
-                CRITICAL FORMATTING REQUIREMENTS:
-                1. Keep it short & punchy (50-100 words maximum)
-                2. Make the first two lines attention-grabbing (they show in message preview)
-                3. Use frequent line breaks - every 1-2 sentences
-                4. Avoid walls of text or big paragraphs
-                
-                USE THESE WHATSAPP FORMATTING ELEMENTS:
-                - Use *asterisks* for bold key points (include the actual * characters)
-                - Use _underscores_ for italic emphasis (include the actual _ characters)
-                - Use simple emojis strategically for structure (professional but engaging)
-                - Create scannable lists with dashes or checkmarks
-                - Use hook emojis at the start and end of important sections
-                
-                STRUCTURE THE MESSAGE LIKE THIS:
-                1. Start with an immediate hook - create curiosity or urgency
-                2. Include 1-2 bold key points (*like this*)
-                3. Add 2-3 short, actionable tips (with line breaks between them)
-                4. End with a simple call-to-action question
-                
-                EXAMPLES OF GOOD CTA ENDINGS:
-                - "Reply 'YES' if you agree!"
-                - "What's your take? Hit reply and let me know!"
-                - "Want more tips? Drop a 👍 and I'll send the next one!"
-                
-                AVOID LIKE THE PLAGUE:
-                - Generic openings like "Hello, hope you're well..."
-                - Lengthy paragraphs or walls of text
-                - Anything that sounds like a broadcast message
-                - AI-generated patterns and clichés
-                
-                IMPORTANT PERSONALITY ELEMENTS:
-                - Keep the distinctive {sanitized_persona} voice with a {sanitized_tone} tone
-                - Make it conversational and directed to ONE person
-                - Sound like a real person sending a quick message
-                - Focus exclusively on "{sanitized_topic}" - no generic content
-                
-                FINAL REMINDER: Ensure your content focuses entirely on {sanitized_topic} and real trends in this field - do NOT default to AI-related content unless the topic is specifically about AI.
-                """
-                max_tokens = 300
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        # Twitter Content
+        with twitter_tab:
+            st.markdown('<div class="content-card">', unsafe_allow_html=True)
+            st.markdown('<h3 class="platform-header"><span class="platform-icon">🐦</span> Twitter Post</h3>', unsafe_allow_html=True)
+            placeholders["twitter_text"] = st.empty()
             
-            payload = {
-                "model": "gpt-4o",
-                "messages": [
-                    {"role": "system", "content": "You are an expert writer who creates authentic, human content with highly distinctive voices. Your specialty is capturing unique personalities and tones that feel like real people, never like AI. Include human imperfections, conversational elements, and natural language patterns in your writing. Focus specifically on the user's exact topic and never default to AI-related content unless the topic is specifically about AI."},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 1.0  # Increased for more human-like variation and unpredictability
-            }
+            # Add WhatsApp image to Twitter tab (the same artifact is shown in both tabs)
+            st.markdown('<h3 class="platform-header" style="margin-top: 2rem;"><span class="platform-icon">🖼️</span> Twitter Image</h3>', unsafe_allow_html=True)
+            placeholders["twitter_image"] = st.empty()
             
-            # Ensure the payload is properly encoded as JSON with ASCII only
-            json_payload = json.dumps(payload, ensure_ascii=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        # WhatsApp Content
+        with whatsapp_tab:
+            st.markdown('<div class="content-card">', unsafe_allow_html=True)
             
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                data=json_payload,
-                verify=True
-            )
+            whatsapp_cols = st.columns([1, 1])
             
-            if response.status_code != 200:
-                st.error(f"Error from OpenAI API: {response.text}")
-                return None
-                
-            response_data = response.json()
-            content = response_data["choices"][0]["message"]["content"]
+            with whatsapp_cols[0]:
+                st.markdown('<h3 class="platform-header"><span class="platform-icon">📱</span> WhatsApp Image</h3>', unsafe_allow_html=True)
+                placeholders["whatsapp_image"] = st.empty()
             
-            # Sanitize the response before returning it
-            return sanitize_text(content)
+            with whatsapp_cols[1]:
+                st.markdown('<h3 class="platform-header"><span class="platform-icon">💬</span> WhatsApp Message</h3>', unsafe_allow_html=True)
+                placeholders["whatsapp_text"] = st.empty()
             
-        except Exception as e:
-            st.error(f"Error generating content: {str(e)}")
-            return None
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        return placeholders
+    
+    # Copy what the session's job has produced so far into its result model. The job runs
+    # on a runner thread and never touches Streamlit; the session only reads its snapshots
+    def apply_job_progress(results, progress):
+        for artifact, result in progress["results"].items():
+            if result.error is not None:
+                results["artifacts"][artifact] = {"error": str(result.error)}
+            elif result.variants is not None:
+                results["artifacts"][artifact] = {"text": result.text, "variants": result.variants}
+            elif result.text is not None:
+                results["artifacts"][artifact] = {"text": result.text}
+            else:
+                results["artifacts"][artifact] = {"image_path": result.image_path}
+        if progress["done"]:
+            if progress["style_guide"] is not None:
+                results["style_guide"] = progress["style_guide"]
+            results["metadata"].update(progress["metadata"])
     
-    def generate_image(prompt, platform):
-        if not api_key:
-            st.error("OpenAI API key is required to generate images")
-            return None
+    # Submit the missing artifacts of `results` as a background job of the session
+    def start_generation(results, fresh=False):
+        missing = [artifact for artifact in ARTIFACTS if artifact not in results["artifacts"]]
+        usage_history = get_usage_history()
+        # The rendering of the previous job's results belongs to that job's trace
+        results["metadata"].pop("render_trace", None)
         
-        # Sanitize input before sending to API
-        sanitized_prompt = sanitize_text(prompt)
-        sanitized_persona = sanitize_text(persona)
-        sanitized_tone = sanitize_text(tone)
+        # Recorded on the runner thread, even when nobody is watching the job anymore
+        def record_usage(job):
+            usage = job.snapshot()["metadata"].get("usage")
+            if usage:
+                usage_history.append(usage, topic=job.request.topic, artifacts=missing)
         
-        try:
-            # Direct API call without using the client object
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            quality = "hd" if image_quality == "HD" else "standard"
-            style = image_style.lower()
-            
-            # Global variable to store the visual style guide for LinkedIn images
-            global linkedin_style_guide
-            
-            if platform == "linkedin":
-                # For LinkedIn Reel/Carousel slides
-                # Extract slide number from the prompt (e.g., "AI in Healthcare - slide 1/3")
-                slide_info = sanitized_prompt.split(" - ")
-                main_topic = slide_info[0]
-                slide_position = "1"
-                if len(slide_info) > 1 and "slide" in slide_info[1]:
-                    slide_position = slide_info[1].replace("slide ", "").split("/")[0]
-                
-                # First slide establishes the visual style for all slides
-                if slide_position == "1":
-                    # Define the visual style for the entire series
-                    style_template_prompt = f"""
-                    Create a detailed visual style guide for a series of three LinkedIn images about '{main_topic}'.
-                    
-                    Define exactly:
-                    1. A specific visual style (e.g., cinematic realism, digital painting, cyberpunk, surreal, etc.)
-                    2. A specific color palette (3-4 key colors with descriptions)
-                    3. The lighting approach (e.g., dramatic side-lighting, soft natural light, etc.)
-                    4. Any recurring visual elements or motifs
-                    5. The overall mood and atmosphere
-                    
-                    Make it cohesive and distinctive so all three images will clearly belong together.
-                    Keep it brief but specific - no more than 5-6 sentences total.
-                    """
-                    
-                    try:
-                        style_guide_payload = {
-                            "model": "gpt-4o",
-                            "messages": [
-                                {"role": "system", "content": "You are a professional art director for visual storytelling campaigns. Create clear, concise style guides that ensure visual consistency across a series of images."},
-                                {"role": "user", "content": style_template_prompt}
-                            ],
-                            "max_tokens": 300,
-                            "temperature": 0.7
-                        }
-                        
-                        json_style_payload = json.dumps(style_guide_payload, ensure_ascii=True)
-                        
-                        style_response = requests.post(
-                            "https://api.openai.com/v1/chat/completions",
-                            headers=headers,
-                            data=json_style_payload,
-                            verify=True
-                        )
-                        
-                        if style_response.status_code == 200:
-                            style_data = style_response.json()
-                            linkedin_style_guide = style_data["choices"][0]["message"]["content"]
-                        else:
-                            # Fallback if API call fails
-                            linkedin_style_guide = f"High-impact {style} style with consistent color palette and mood throughout all images. Maintain identical artistic approach across all visuals."
-                    except Exception as e:
-                        # Fallback if any exception occurs
-                        linkedin_style_guide = f"High-impact {style} style with consistent color palette and mood throughout all images. Maintain identical artistic approach across all visuals."
-                
-                # Common guidelines for all LinkedIn images to ensure narrative flow and visual consistency
-                common_styling = f"""
-                CRITICAL STYLING REQUIREMENTS:
-                - Follow this exact visual style guide for ALL THREE images:
-                {linkedin_style_guide}
-                
-                IMPORTANT IMAGE GUIDELINES:
-                - Create concept-driven, story-focused imagery with NO text, infographics, charts, or data elements
-                - The three images MUST look like they were created by the same artist with identical style and technique
-                - Use consistent lighting, color palette, and visual treatment across all images
-                - Each image should build upon the narrative while maintaining visual consistency
-                - Focus on powerful metaphors and symbolism that support the topic
-                - Avoid generic stock photo looks - create unique, memorable visuals
-                """
-                
-                # Different prompts based on slide position to create a progressive narrative
-                if slide_position == "1":
-                    # First slide: Introduction/Problem
-                    image_prompt = f"""
-                    Create the FIRST in a series of three visually consistent images about '{main_topic}' for a LinkedIn carousel.
-                    
-                    This first image should introduce the topic by:
-                    - Visualizing the main concept, challenge, or current state related to {main_topic}
-                    - Using powerful visual storytelling to capture attention and draw viewers in
-                    - Creating an emotionally resonant scene that establishes the narrative
-                    
-                    {common_styling}
-                    
-                    SPECIFIC IMAGE DIRECTION:
-                    Create a compelling, high-impact visual with strong focal points and clear storytelling.
-                    Example approach: "A hyper-realistic image showing [specific scene related to the main topic that introduces the concept]"
-                    
-                    Remember this first image establishes the visual style for the entire series - make it striking and memorable.
-                    """
-                elif slide_position == "2":
-                    # Second slide: Development/Contrast/Transformation
-                    image_prompt = f"""
-                    Create the SECOND in a series of three visually consistent images about '{main_topic}' for a LinkedIn carousel.
-                    
-                    This second image should develop the narrative by:
-                    - Showing a transformation, contrast, or deeper exploration of {main_topic}
-                    - Building on the concept introduced in the first image
-                    - Creating a bridge between the problem and solution
-                    
-                    {common_styling}
-                    
-                    SPECIFIC IMAGE DIRECTION:
-                    Create a visual that advances the story through contrast or transformation.
-                    Example approach: "A split-screen or comparative visual showing [specific contrast or transformation related to the topic]"
-                    
-                    This image MUST maintain perfect visual consistency with the first image in style, colors, and technique.
-                    """
-                else:
-                    # Third slide: Resolution/Outcome/Future
-                    image_prompt = f"""
-                    Create the THIRD in a series of three visually consistent images about '{main_topic}' for a LinkedIn carousel.
-                    
-                    This final image should complete the narrative by:
-                    - Showing the resolution, outcome, or future state related to {main_topic}
-                    - Providing a clear conclusion to the visual story
-                    - Leaving viewers with a powerful final impression
-                    
-                    {common_styling}
-                    
-                    SPECIFIC IMAGE DIRECTION:
-                    Create a visual that brings closure to the narrative through a powerful resolution.
-                    Example approach: "A forward-looking scene showing [specific outcome or future state related to the topic]"
-                    
-                    This final image MUST maintain perfect visual consistency with the previous two images in style, colors, and technique.
-                    """
-            
-            elif platform == "whatsapp":
-                # For WhatsApp - a single high-impact, shareable image
-                image_prompt = f"""
-                Create a single, high-impact visual about '{sanitized_prompt}' optimized for WhatsApp sharing.
-                
-                CRITICAL REQUIREMENTS:
-                - Create a POWERFUL, ATTENTION-GRABBING image that captures the core message of the topic
-                - Focus on one strong concept or metaphor that instantly communicates the essence of '{sanitized_prompt}'
-                - Use striking composition, bold colors, and strong focal points to make it immediately impactful
-                - Create something highly shareable that will stop people from scrolling
-                - Avoid ANY text, infographics, or data elements - focus purely on visual storytelling
-                
-                SPECIFIC IMAGE DIRECTION:
-                - Style: Use a {style} visual style with emotional impact
-                - Approach: Create a symbolic or metaphorical representation that evokes the right emotion
-                - Composition: Use dramatic lighting, perspective, or contrast to create visual interest
-                - Example: "A striking [specific visual related directly to the topic] that symbolizes [core concept]"
-                
-                Make it impossible to ignore - this single image needs to tell the entire story at a glance.
-                """
-            
-            payload = {
-                "model": "dall-e-3",
-                "prompt": sanitize_text(image_prompt),
-                "size": "1024x1024",
-                "quality": quality,
-                "n": 1
-            }
-            
-            # Ensure the payload is properly encoded as JSON with ASCII only
-            json_payload = json.dumps(payload, ensure_ascii=True)
-            
-            response = requests.post(
-                "https://api.openai.com/v1/images/generations",
-                headers=headers,
-                data=json_payload,
-                verify=True
-            )
-            
-            if response.status_code != 200:
-                st.error(f"Error from OpenAI API: {response.text}")
-                return None
-                
-            response_data = response.json()
-            image_url = response_data["data"][0]["url"]
-            image_response = requests.get(image_url)
-            image = Image.open(io.BytesIO(image_response.content))
-            
-            return image
-            
-        except Exception as e:
-            st.error(f"Error generating image: {str(e)}")
-            return None
+        job = get_job_queue().submit(
+            generator, ContentRequest(topic, persona, tone, missing, results["style_guide"], fresh, text_variants),
+            stream=stream_text, on_done=record_usage,
+            # Enough to rebuild the result model in a new session (e.g. after a page reload)
+            details={**results, "artifacts": dict(results["artifacts"]), "metadata": dict(results["metadata"])}
+        )
+        st.session_state["job_id"] = job.job_id
+        st.query_params["job"] = job.job_id
+        return job
     
-    def get_download_link(img, filename, text):
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        href = f'<a href="data:image/png;base64,{img_str}" download="{filename}"><button class="copy-btn">{text}</button></a>'
-        return href
+    # Show the timing and connection figures of the last generation
+    def render_run_metadata(metadata):
+        # Time until each post first became visible (perceived latency)
+        if metadata.get("first_token_seconds"):
+            st.caption("⚡ First visible text: " + " · ".join(
+                f"{PLATFORM_LABELS[artifact[:-len('_text')]]} {seconds:.2f}s"
+                for artifact, seconds in sorted(metadata["first_token_seconds"].items(), key=lambda item: item[1])
+            ))
+        
+        # Report how much connection setup the pooled transport saved in that run
+        savings = metadata.get("connections")
+        if savings:
+            st.caption(
+                f"🔌 {savings['requests']} API requests over {savings['connections']} new connections "
+                f"({savings['reused']} reused, {savings['handshake_seconds'] * 1000:.0f} ms spent on handshakes, "
+                f"~{savings['saved_seconds'] * 1000:.0f} ms saved by keep-alive, "
+                f"{savings['coalesced']} duplicate calls shared)"
+            )
+            if savings.get("retries") or savings.get("throttled_seconds", 0) >= 0.1:
+                st.caption(
+                    f"🚦 {savings['retries']} retries after rate limits or server errors, "
+                    f"{savings['throttled_seconds']:.1f}s spent waiting for the rate limit budget"
+                )
     
-    # Function to create a copy button that references content by ID
-    def get_copy_button_for_id(content_id, button_text="Copy Text"):
-        return f'''
-        <div style="margin-top: 10px;">
-            <button class="copy-btn" data-content-id="{content_id}" style="cursor: pointer;">{button_text}</button>
-        </div>
-        '''
+    # Everything that determines the generated content
+    current_inputs = {
+        "topic": topic,
+        "persona": persona,
+        "tone": tone,
+        "image_style": image_style,
+        "image_quality": image_quality,
+        "text_variants": text_variants
+    }
     
-    # Function to create a hidden div with content to be copied
-    def get_hidden_content_div(content_id, content):
-        # Properly escape the content for HTML
-        escaped_content = html.escape(content)
-        return f'''
-        <div id="{content_id}" class="hidden-content" style="display:none;">
-            {escaped_content}
-        </div>
-        '''
+    # The session's result model survives reruns, so widget interactions only re-render it.
+    # A new session whose URL names a job that is still known picks that run up again
+    job_queue = get_job_queue()
+    results = st.session_state.get("results")
+    job = job_queue.get(st.session_state.get("job_id"))
+    if results is None and job is None:
+        job = job_queue.get(st.query_params.get("job"))
+        if job is not None and job.details is not None:
+            results = {**job.details, "artifacts": dict(job.details["artifacts"]), "metadata": dict(job.details["metadata"])}
+            st.session_state["results"] = results
+            st.session_state["job_id"] = job.job_id
+    if job is not None and results is not None:
+        apply_job_progress(results, job.snapshot())
+    generating = job is not None and not job.done()
     
-    # Function to safely escape content for JavaScript
-    def js_escape(content):
-        if content is None:
-            return ""
-        # More thorough escaping for JavaScript string safety
-        return json.dumps(content)[1:-1]  # Remove the quotes added by json.dumps
-        
     # Generate content when button is clicked
     with generate_placeholder.container():
+        fresh = fresh_variation
+        regenerate = st.session_state.pop("regenerate", None)
+        if regenerate and results is not None and results["inputs"] == current_inputs and not generating:
+            # Drop just the requested artifacts; the job below fills them in again, bypassing the caches
+            for artifact in regenerate:
+                results["artifacts"].pop(artifact, None)
+            job = start_generation(results, fresh=True)
+            generating = True
+        
         if st.button("🔮 Generate Content", disabled=not api_key or not topic, use_container_width=True):
             if not topic:
                 st.error("Please enter a topic or insight")
+            elif generating and results["inputs"] == current_inputs and not fresh_variation:
+                st.info("This content is still being generated. It keeps going in the background if you change tabs or reload the page.")
+            elif (results is not None and results["inputs"] == current_inputs and not fresh_variation
+                    and all(artifact in results["artifacts"] and "error" not in results["artifacts"][artifact] for artifact in ARTIFACTS)):
+                st.info("Nothing changed since the last run, so the content below was kept. Turn on 'Fresh variation' in the sidebar for a new take.")
             else:
-                with st.spinner("Generating content..."):
-                    # Create tabs for each platform
-                    linkedin_tab, twitter_tab, whatsapp_tab = st.tabs(["LinkedIn", "Twitter", "WhatsApp"])
-                    
-                    # LinkedIn Content
-                    with linkedin_tab:
-                        st.markdown('<div class="content-card">', unsafe_allow_html=True)
-                        st.markdown('<h3 class="platform-header"><span class="platform-icon">🔗</span> LinkedIn Post</h3>', unsafe_allow_html=True)
-                        
-                        # Generate LinkedIn post
-                        linkedin_content = generate_text_content(topic, persona, tone, "linkedin")
-                        if linkedin_content:
-                            st.markdown('<div class="linkedin-message">', unsafe_allow_html=True)
-                            st.markdown(linkedin_content)
-                            st.markdown('</div>', unsafe_allow_html=True)
-                            
-                            # Generate unique ID for this content
-                            content_id = f"linkedin_content_{hash(linkedin_content)}"
-                            
-                            # Create a hidden div with the content
-                            st.markdown(get_hidden_content_div(content_id, linkedin_content), unsafe_allow_html=True)
-                            
-                            # Create a copy button that references the hidden content
-                            st.markdown(get_copy_button_for_id(content_id), unsafe_allow_html=True)
-                        
-                        # LinkedIn Reel (3 slides)
-                        st.markdown('<h3 class="platform-header" style="margin-top: 2rem;"><span class="platform-icon">🎬</span> LinkedIn Reel Slides</h3>', unsafe_allow_html=True)
-                        
-                        slide_cols = st.columns(3)
-                        linkedin_slides = []
-                        
-                        for i, col in enumerate(slide_cols):
-                            with col:
-                                with st.spinner(f"Creating slide {i+1}..."):
-                                    slide_image = generate_image(f"{topic} - slide {i+1}/3", "linkedin")
-                                    if slide_image:
-                                        st.image(slide_image, use_container_width=True)
-                                        st.markdown(get_download_link(slide_image, f"linkedin_slide_{i+1}.png", f"Download Slide {i+1}"), unsafe_allow_html=True)
-                                        linkedin_slides.append(slide_image)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # Twitter Content
-                    with twitter_tab:
-                        st.markdown('<div class="content-card">', unsafe_allow_html=True)
-                        st.markdown('<h3 class="platform-header"><span class="platform-icon">🐦</span> Twitter Post</h3>', unsafe_allow_html=True)
-                        
-                        twitter_content = generate_text_content(topic, persona, tone, "twitter")
-                        if twitter_content:
-                            st.markdown('<div class="twitter-message">', unsafe_allow_html=True)
-                            st.markdown(twitter_content)
-                            st.markdown('</div>', unsafe_allow_html=True)
-                            
-                            # Generate unique ID for this content
-                            content_id = f"twitter_content_{hash(twitter_content)}"
-                            
-                            # Create a hidden div with the content
-                            st.markdown(get_hidden_content_div(content_id, twitter_content), unsafe_allow_html=True)
-                            
-                            # Create a copy button that references the hidden content
-                            st.markdown(get_copy_button_for_id(content_id), unsafe_allow_html=True)
-                        
-                        # Add WhatsApp image to Twitter tab
-                        st.markdown('<h3 class="platform-header" style="margin-top: 2rem;"><span class="platform-icon">🖼️</span> Twitter Image</h3>', unsafe_allow_html=True)
-                        
-                        with st.spinner("Creating Twitter image..."):
-                            # Use the same image generation logic as WhatsApp
-                            twitter_image = generate_image(topic, "whatsapp")  # Using WhatsApp image generation logic
-                            if twitter_image:
-                                st.image(twitter_image, use_container_width=True)
-                                st.markdown(get_download_link(twitter_image, "twitter_image.png", "Download Image"), unsafe_allow_html=True)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # WhatsApp Content
-                    with whatsapp_tab:
-                        st.markdown('<div class="content-card">', unsafe_allow_html=True)
-                        
-                        whatsapp_cols = st.columns([1, 1])
-                        
-                        with whatsapp_cols[0]:
-                            st.markdown('<h3 class="platform-header"><span class="platform-icon">📱</span> WhatsApp Image</h3>', unsafe_allow_html=True)
-                            
-                            with st.spinner("Creating WhatsApp image..."):
-                                whatsapp_image = generate_image(topic, "whatsapp")
-                                if whatsapp_image:
-                                    st.image(whatsapp_image, use_container_width=True)
-                                    st.markdown(get_download_link(whatsapp_image, "whatsapp_image.png", "Download Image"), unsafe_allow_html=True)
-                        
-                        with whatsapp_cols[1]:
-                            st.markdown('<h3 class="platform-header"><span class="platform-icon">💬</span> WhatsApp Message</h3>', unsafe_allow_html=True)
-                            
-                            whatsapp_content = generate_text_content(topic, persona, tone, "whatsapp")
-                            if whatsapp_content:
-                                st.markdown('<div class="whatsapp-message">', unsafe_allow_html=True)
-                                st.markdown(whatsapp_content)
-                                st.markdown('</div>', unsafe_allow_html=True)
-                                
-                                # Generate unique ID for this content
-                                content_id = f"whatsapp_content_{hash(whatsapp_content)}"
-                                
-                                # Create a hidden div with the content
-                                st.markdown(get_hidden_content_div(content_id, whatsapp_content), unsafe_allow_html=True)
-                                
-                                # Create a copy button that references the hidden content
-                                st.markdown(get_copy_button_for_id(content_id), unsafe_allow_html=True)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
+                # A run for other inputs is superseded; what it finished stays in its job
+                if generating:
+                    job.cancel()
+                
+                # Unchanged inputs only fill in what is missing or failed; anything else starts over
+                if results is None or results["inputs"] != current_inputs or fresh_variation:
+                    results = {
+                        "inputs": current_inputs,
+                        "artifacts": {},
+                        "style_guide": None,
+                        "metadata": {"generated_at": datetime.now().isoformat(timespec="seconds")}
+                    }
+                else:
+                    results["artifacts"] = {
+                        artifact: entry for artifact, entry in results["artifacts"].items() if "error" not in entry
+                    }
+                st.session_state["results"] = results
+                job = start_generation(results, fresh)
+                generating = True
+        
+        if results is not None:
+            if results["inputs"] != current_inputs:
+                st.caption(f"Showing the content generated for \"{results['inputs']['topic']}\". Click Generate Content to update it for the current settings.")
+            
+            # While the job runs, only this part of the page reruns, to poll it
+            @st.fragment(run_every=JOB_POLL_SECONDS if generating else None)
+            def render_results():
+                # A regenerate click inside the fragment needs the whole script to start its job
+                if "regenerate" in st.session_state:
+                    st.rerun()
+                
+                progress = job.snapshot() if job is not None else None
+                running = progress is not None and not progress["done"]
+                if progress is not None:
+                    apply_job_progress(results, progress)
+                    if generating and not running:
+                        # Finished: rerun the page once, for the sidebar's usage and cache figures
+                        st.rerun()
+                
+                if running:
+                    requested = progress["artifacts"] or ARTIFACTS
+                    ready = sum(artifact in progress["results"] for artifact in requested)
+                    st.caption(f"⏳ Generating content: {ready} of {len(requested)} ready")
+                
+                # The job's trace ends on its runner thread; the first rendering of its results is
+                # timed here and grafted onto it, so the waterfall runs until the content is shown
+                timed = not running and results["metadata"].get("trace") and "render_trace" not in results["metadata"]
+                with trace("render_results") if timed else nullcontext() as render_run:
+                    placeholders = create_result_layout()
+                    for artifact in ARTIFACTS:
+                        if running and artifact in progress["partial_text"]:
+                            placeholders[artifact].markdown(progress["partial_text"][artifact] + "▌")
+                            continue
+                        with span("render", artifact=artifact):
+                            render_artifact(
+                                placeholders[artifact], artifact, results["artifacts"].get(artifact),
+                                generating=running, can_regenerate=results["inputs"] == current_inputs and not running
+                            )
+                if timed:
+                    results["metadata"]["render_trace"] = graft(results["metadata"]["trace"], render_run)
+                
+                if not running:
+                    render_run_metadata(results["metadata"])
+                    if progress is not None and progress["status"] == "failed":
+                        st.error(f"Generation failed: {results['metadata'].get('error')}")
+                    if show_trace and results["metadata"].get("trace"):
+                        render_trace(results["metadata"])
+            
+            render_results()
+    
+    # Cache counters are filled in last so they include this run
+    with cache_stats_placeholder.container():
+        if response_cache is not None:
+            cache_stats = response_cache.stats()
+            st.caption(
+                f"Text: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+                f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1024:.0f} KB)"
+            )
+        image_stats = image_store.stats()
+        st.caption(
+            f"Images: {image_stats['hits']} hits · {image_stats['misses']} misses · "
+            f"{image_stats['images']} stored ({image_stats['bytes'] / (1024 * 1024):.1f} MB)"
+        )
+    
+    # Usage is filled in last as well, with the pre-flight estimate for the current inputs
+    with usage_placeholder.container():
+        if topic:
+            estimate = preflight_estimate(normalize_text(topic), normalize_text(persona), normalize_text(tone), image_quality, text_variants)["total"]
+            # Without tiktoken (or its encoding files) the prompt tokens are approximated
+            approximate = "" if exact_token_counts() else "~"
+            st.caption(
+                f"Next run: up to ~${estimate['cost']:.2f} ({approximate}{estimate['prompt_tokens']:,} prompt tokens, "
+                f"≤{estimate['completion_tokens']:,} completion tokens, {estimate['images']} images)"
+            )
+        
+        usage = results["metadata"].get("usage") if results is not None else None
+        if usage:
+            st.caption(f"Last run: ${usage['total']['cost']:.3f}")
+            st.dataframe(usage_rows(usage), hide_index=True, use_container_width=True)
+        
+        totals, runs = get_usage_history().totals_by_platform()
+        if runs and totals["total"]["cost"] > 0:
+            st.caption(f"All {runs} runs: ${totals['total']['cost']:.2f} · " + " · ".join(
+                f"{PLATFORM_LABELS.get(platform, platform)} {row['cost'] / totals['total']['cost']:.0%}"
+                for platform, row in sorted(totals.items(), key=lambda item: -item[1]["cost"]) if platform != "total"
+            ))
     
     # Footer
     st.markdown("---")
     st.markdown(f"© {datetime.now().year} AI Content Generator | Built with Streamlit, OpenAI GPT, and DALL-E")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
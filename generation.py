@@ -0,0 +1,602 @@
+"""
+Content generation engine
+
+The prompts and OpenAI calls behind the LinkedIn, Twitter and WhatsApp content,
+independent of Streamlit so the same code runs in the app, in batch jobs and in
+worker threads.
+"""
+
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from openai_transport import iter_sse_events
+from prompt_registry import PROMPTS
+from ranking import rank_variants
+from validators import post_validator
+from text_normalize import StreamNormalizer, normalize_text
+from usage_ledger import UsageLedger, recording_into
+from tracing import in_current_context, span
+from artifact_store import MAX_IMAGE_BYTES, decode_b64_image, verify_image_bytes
+
+# Number of OpenAI calls that may run at the same time for one content set
+# (3 texts + style guide + 3 LinkedIn slides + the shared Twitter/WhatsApp image)
+MAX_GENERATION_WORKERS = 8
+
+# How DALL-E returns images: "b64_json" inlines them in the API response, "url" needs a
+# second download from the image CDN (see benchmarks/image_retrieval.py)
+IMAGE_RESPONSE_FORMAT = os.environ.get("IMAGE_RESPONSE_FORMAT", "b64_json")
+
+# Fix-up requests sent for a post that still breaks its platform's rules after the local
+# repairs (0 = show it as it is)
+POST_FIX_UP_ATTEMPTS = int(os.environ.get("POST_FIX_UP_ATTEMPTS", "1"))
+
+# Display names of the target platforms
+PLATFORM_LABELS = {"linkedin": "LinkedIn", "twitter": "Twitter", "whatsapp": "WhatsApp"}
+
+# Carousel style guides kept per StyleGuideCache (least recently used ones are dropped)
+STYLE_GUIDE_CACHE_SIZE = 256
+
+# Everything one content set consists of
+ARTIFACTS = [
+    "linkedin_text",
+    "linkedin_slide_1",
+    "linkedin_slide_2",
+    "linkedin_slide_3",
+    "twitter_text",
+    "twitter_image",
+    "whatsapp_image",
+    "whatsapp_text",
+]
+
+# What to generate: the topic, persona and tone of a content set and the artifacts wanted
+# (all of them by default); `style_guide` keeps regenerated slides in an existing carousel's
+# style, `fresh` bypasses the caches and `variants` asks for that many versions of each post
+ContentRequest = namedtuple(
+    "ContentRequest", ["topic", "persona", "tone", "artifacts", "style_guide", "fresh", "variants"],
+    defaults=(None, None, False, 1)
+)
+
+# A finished artifact: its text or image path, or the GenerationError it failed with. Posts
+# requested in several variants list them best first in `variants`, and `text` is the best one
+ArtifactResult = namedtuple(
+    "ArtifactResult", ["artifact", "text", "image_path", "error", "variants"],
+    defaults=(None, None, None, None)
+)
+
+# The normalized text of a post written so far, while it is streamed
+TextDelta = namedtuple("TextDelta", ["artifact", "text"])
+
+# Everything a ContentRequest produced: ArtifactResults by artifact, the carousel's style
+# guide, the usage summary of this run and the wall time
+ContentSet = namedtuple("ContentSet", ["request", "results", "style_guide", "usage", "seconds"])
+
+# Raised by the generation functions so failures can be reported by the caller
+class GenerationError(Exception):
+    pass
+
+class StyleGuideCache:
+    """Thread-safe LRU of LinkedIn carousel style guides by (session, topic, image style)"""
+
+    def __init__(self, max_entries=STYLE_GUIDE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> Future of the style guide
+
+    # The style guide for `key`. `create()` runs once per key; concurrent callers wait for
+    # that call instead of making their own. With `fresh`, a new one replaces the cached one.
+    # Failures are passed to every waiter and not kept, so the next call tries again
+    def get(self, key, create, fresh=False):
+        with self._lock:
+            future = None if fresh else self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = self._entries[key] = Future()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if not owner:
+            return future.result()
+
+        try:
+            future.set_result(create())
+        except BaseException as e:
+            with self._lock:
+                if self._entries.get(key) is future:
+                    del self._entries[key]
+            future.set_exception(e)
+        return future.result()
+
+
+class ContentGenerator:
+    """Generates the text posts and images for one API key and image settings"""
+
+    # `session_id` scopes the carousel style guides in `style_guides` (shared by all sessions
+    # of a server); without a cache, the generator keeps its own
+    def __init__(self, api_key, transport, image_store, response_cache=None,
+                 image_style="Photorealistic", image_quality="Standard",
+                 style_guides=None, session_id=None):
+        self.api_key = api_key
+        self.transport = transport
+        self.image_store = image_store
+        self.response_cache = response_cache
+        self.image_style = image_style
+        self.image_quality = image_quality
+        self.style_guides = StyleGuideCache() if style_guides is None else style_guides
+        self.session_id = session_id
+        self.usage = UsageLedger()
+
+    # Start generating `request` in worker threads; iterate the returned GenerationRun for
+    # its results as they finish (and, with `stream`, the TextDeltas of the posts)
+    def start(self, request, stream=False):
+        return GenerationRun(self, request, stream)
+
+    # Generate `request` and return its ContentSet; failed artifacts carry their error
+    def generate(self, request):
+        started = time.perf_counter()
+        run = self.start(request)
+        results = {result.artifact: result for result in run}
+        return ContentSet(request, results, run.style_guide(), run.usage.summary(), time.perf_counter() - started)
+
+    # generate() for asyncio code: the calls run in the same worker threads and share the
+    # transport's connection pool, the event loop only waits for them
+    async def agenerate(self, request):
+        return await asyncio.get_running_loop().run_in_executor(None, self.generate, request)
+
+    # Async iterator over the events of start(request, stream)
+    async def astream(self, request, stream=True):
+        loop = asyncio.get_running_loop()
+        run = self.start(request, stream)
+        batches = run.batches()
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, next, batches, None)
+                if batch is None:
+                    return
+                for event in batch:
+                    yield event
+        finally:
+            # Also when cancelled while a worker thread is still waiting for the next batch
+            run.close()
+
+    # Send a chat completion, serving it from the response cache when enabled (unless `fresh`).
+    # With `on_delta`, the response is streamed and each content delta is passed to it as it arrives.
+    # Its usage is recorded under `platform` and `kind`
+    def chat_completion(self, payload, on_delta=None, fresh=False, platform=None, kind="text"):
+        with span("chat_completion", platform=platform, kind=kind, streamed=on_delta is not None) as attributes:
+            cache_key = None
+            if self.response_cache is not None:
+                with span("response_cache_lookup"):
+                    cache_key = self.response_cache.key(payload)
+                    cached = None if fresh else self.response_cache.get(cache_key)
+                if cached is not None:
+                    attributes["cached"] = True
+                    self.usage.record_chat(platform, kind, payload, cached.get("usage"), reused=True)
+                    return cached
+            
+            if on_delta is None:
+                response = self.transport.post_json("/chat/completions", payload, self.api_key)
+            else:
+                # The last event of the stream then carries the usage block
+                stream_payload = {**payload, "stream_options": {"include_usage": True}}
+                response = self.transport.stream_json("/chat/completions", stream_payload, self.api_key)
+            
+            if response.status_code != 200:
+                raise GenerationError(f"Error from OpenAI API: {response.text}")
+            
+            if on_delta is None:
+                response_data = response.json()
+            else:
+                # Assemble the streamed deltas into the same shape as a regular response. With
+                # several choices (`n`), only the first one is passed to `on_delta`
+                deltas = {}
+                finish_reasons = {}
+                usage = None
+                with span("read_stream") as stream_attributes, response:
+                    started = time.perf_counter()
+                    for event in iter_sse_events(response):
+                        usage = event.get("usage") or usage
+                        for choice in event.get("choices", []):
+                            index = choice.get("index", 0)
+                            delta = choice.get("delta", {}).get("content")
+                            if delta:
+                                if not deltas:
+                                    stream_attributes["first_token_seconds"] = round(time.perf_counter() - started, 4)
+                                deltas.setdefault(index, []).append(delta)
+                                if index == 0:
+                                    on_delta(delta)
+                            finish_reasons[index] = choice.get("finish_reason") or finish_reasons.get(index)
+                    stream_attributes["deltas"] = sum(len(parts) for parts in deltas.values())
+                response_data = {
+                    "choices": [
+                        {
+                            "index": index,
+                            "message": {"role": "assistant", "content": "".join(deltas.get(index, []))},
+                            "finish_reason": finish_reasons.get(index)
+                        }
+                        for index in sorted(set(deltas) | set(finish_reasons) | {0})
+                    ],
+                    "usage": usage
+                }
+            
+            self.usage.record_chat(
+                platform, kind, payload, response_data.get("usage"),
+                content="".join(choice["message"]["content"] for choice in response_data["choices"])
+            )
+            attributes.update(response_data.get("usage") or {})
+            if cache_key is not None:
+                with span("response_cache_store"):
+                    self.response_cache.put(cache_key, response_data)
+            return response_data
+    
+    # Content generation functions. With `on_text`, the response is streamed and `on_text`
+    # receives the normalized text received so far after every chunk
+    def generate_text_content(self, topic, persona, tone, platform, on_text=None, fresh=False):
+        return self.generate_text_variants(topic, persona, tone, platform, 1, on_text, fresh)[0]
+    
+    # `variants` versions of a post from one chat call (the prompt is paid once), ranked best
+    # first; `on_text` follows the first one as it is streamed
+    def generate_text_variants(self, topic, persona, tone, platform, variants=1, on_text=None, fresh=False):
+        if not self.api_key:
+            raise GenerationError("OpenAI API key is required to generate content")
+        
+        # Sanitize inputs before sending to API
+        sanitized_topic = normalize_text(topic)
+        sanitized_persona = normalize_text(persona)
+        sanitized_tone = normalize_text(tone)
+        
+        try:
+            with span("render_prompt") as attributes:
+                prompt = PROMPTS.text_prompt(sanitized_topic, sanitized_persona, sanitized_tone, platform)
+                attributes["tokens"] = prompt.tokens
+            payload = {
+                "model": "gpt-4o",
+                "messages": [
+                    {"role": "system", "content": prompt.system},
+                    {"role": "user", "content": prompt.user}
+                ],
+                "max_tokens": prompt.max_tokens,
+                "temperature": 1.0  # Increased for more human-like variation and unpredictability
+            }
+            if variants > 1:
+                payload["n"] = variants
+            
+            on_delta = None
+            if on_text is not None:
+                normalizer = StreamNormalizer()
+                streamed = []
+                
+                def show_delta(delta):
+                    streamed.append(normalizer.feed(delta))
+                    on_text("".join(streamed))
+                on_delta = show_delta
+            
+            response_data = self.chat_completion(payload, on_delta, fresh, platform=platform)
+            if on_text is not None:
+                # The last grapheme of the stream is held back until it ends
+                tail = normalizer.flush()
+                if tail:
+                    streamed.append(tail)
+                    on_text("".join(streamed))
+            
+            # Sanitize the responses before returning them
+            candidates = [normalize_text(choice["message"]["content"]) for choice in response_data["choices"]]
+            return self.finish_posts(platform, candidates, prompt.max_tokens, fresh)
+            
+        except GenerationError:
+            raise
+        except Exception as e:
+            raise GenerationError(f"Error generating content: {str(e)}")
+    
+    # Repair the posts locally and rank them, the ones passing every check of the platform
+    # first. When none does, only the best one goes back to the model with a short fix-up
+    # request listing its problems, instead of generating the post again
+    def finish_posts(self, platform, candidates, max_tokens, fresh=False):
+        validator = post_validator(platform)
+        with span("validate_posts", platform=platform) as attributes:
+            repaired = [validator.repair(text) for text in candidates]
+            ranked = rank_variants(platform, repaired) if len(repaired) > 1 else repaired
+            checked = sorted(((text, validator.check(text)) for text in ranked), key=lambda item: bool(item[1]))
+            attributes["violations"] = [violation.rule for violation in checked[0][1]]
+        
+        best, violations = checked[0]
+        for _ in range(POST_FIX_UP_ATTEMPTS if violations else 0):
+            prompt = PROMPTS.fix_up_prompt(PLATFORM_LABELS[platform], best, [violation.fix for violation in violations], max_tokens)
+            payload = {
+                "model": "gpt-4o",
+                "messages": [
+                    {"role": "system", "content": prompt.system},
+                    {"role": "user", "content": prompt.user}
+                ],
+                "max_tokens": prompt.max_tokens,
+                "temperature": 0.3
+            }
+            try:
+                response_data = self.chat_completion(payload, fresh=fresh, platform=platform, kind="fix_up")
+            except Exception:
+                # The fix-up is optional: if it fails (an API error, retries used up, a dropped
+                # connection) the repaired post is shown as it is rather than lost
+                break
+            fixed = validator.repair(normalize_text(response_data["choices"][0]["message"]["content"]))
+            fixed_violations = validator.check(fixed)
+            if len(fixed_violations) >= len(violations):
+                break
+            best, violations = fixed, fixed_violations
+            if not violations:
+                break
+        return [best] + [text for text, _ in checked[1:]]
+    
+    # The first LinkedIn slide establishes the visual style for all slides, so the
+    # style guide is generated once per carousel (topic and image style) in a session,
+    # before any slide image is requested, and reused by slide regenerations
+    def generate_linkedin_style_guide(self, topic, fresh=False):
+        main_topic = normalize_text(topic).split(" - ")[0]
+        style = self.image_style.lower()
+        
+        def create():
+            # Define the visual style for the entire series
+            prompt = PROMPTS.style_guide_prompt(main_topic)
+            style_guide_payload = {
+                "model": "gpt-4o",
+                "messages": [
+                    {"role": "system", "content": prompt.system},
+                    {"role": "user", "content": prompt.user}
+                ],
+                "max_tokens": prompt.max_tokens,
+                "temperature": 0.7
+            }
+
+            style_data = self.chat_completion(style_guide_payload, fresh=fresh, platform="linkedin", kind="style_guide")
+            # Normalized once here, as it goes into the prompt of every slide
+            return normalize_text(style_data["choices"][0]["message"]["content"])
+
+        try:
+            return self.style_guides.get((self.session_id, main_topic, self.image_style), create, fresh)
+        except Exception:
+            # Fallback if any exception occurs (not cached, so the next slide tries again)
+            return f"High-impact {style} style with consistent color palette and mood throughout all images. Maintain identical artistic approach across all visuals."
+    
+    # LinkedIn slides follow `style_guide` (by default the carousel's cached one)
+    def generate_image(self, prompt, platform, style_guide=None, fresh=False):
+        if not self.api_key:
+            raise GenerationError("OpenAI API key is required to generate images")
+        
+        # Sanitize input before sending to API
+        sanitized_prompt = normalize_text(prompt)
+        
+        try:
+            quality = "hd" if self.image_quality == "HD" else "standard"
+            style = self.image_style.lower()
+            
+            if platform == "linkedin":
+                if style_guide is None:
+                    style_guide = self.generate_linkedin_style_guide(sanitized_prompt)
+                
+                # For LinkedIn Reel/Carousel slides
+                # Extract slide number from the prompt (e.g., "AI in Healthcare - slide 1/3")
+                slide_info = sanitized_prompt.split(" - ")
+                main_topic = slide_info[0]
+                slide_position = "1"
+                if len(slide_info) > 1 and "slide" in slide_info[1]:
+                    slide_position = slide_info[1].replace("slide ", "").split("/")[0]
+                
+                # Each slide position has its own part of the narrative (introduction, development,
+                # resolution), all following the same style guide
+                with span("render_prompt"):
+                    image_prompt = PROMPTS.slide_prompt(main_topic, slide_position, style_guide).user
+            
+            elif platform == "whatsapp":
+                # For WhatsApp - a single high-impact, shareable image
+                with span("render_prompt"):
+                    image_prompt = PROMPTS.image_prompt(sanitized_prompt, style).user
+            
+            payload = {
+                "model": "dall-e-3",
+                # Rendered from normalized inputs and style guide, so normalized already
+                "prompt": image_prompt,
+                "size": "1024x1024",
+                "quality": quality,
+                "n": 1,
+                "response_format": IMAGE_RESPONSE_FORMAT
+            }
+            
+            # Serve a previously generated image for the exact same request from the store
+            artifact_key = self.image_store.key(payload["model"], payload["prompt"], quality, style, payload["size"])
+            if not fresh:
+                with span("image_store_lookup") as attributes:
+                    stored_path = self.image_store.get_path(artifact_key)
+                    attributes["hit"] = stored_path is not None
+                if stored_path:
+                    self.usage.record_image(platform, payload["model"], quality, payload["size"], reused=True)
+                    return stored_path
+            
+            response = self.transport.post_json("/images/generations", payload, self.api_key)
+            
+            if response.status_code != 200:
+                raise GenerationError(f"Error from OpenAI API: {response.text}")
+                
+            with span("parse_response"):
+                response_data = response.json()
+            image_data = response_data["data"][0]
+            if image_data.get("b64_json"):
+                # The image came inline with the API response: no second round trip
+                with span("decode_b64") as attributes:
+                    image_bytes = decode_b64_image(image_data["b64_json"])
+                    attributes["bytes"] = len(image_bytes)
+            else:
+                with span("cdn_download") as attributes:
+                    image_bytes = self.transport.download(image_data["url"], MAX_IMAGE_BYTES)
+                    attributes["bytes"] = len(image_bytes)
+            with span("verify_image"):
+                verify_image_bytes(image_bytes)
+            self.usage.record_image(platform, payload["model"], quality, payload["size"])
+            
+            # Keep the original bytes as-is; the path is what gets rendered and downloaded.
+            # Nothing is decoded here, only the thumbnail step needs pixels
+            if fresh:
+                artifact_key = self.image_store.variant_key(artifact_key, image_bytes)
+            with span("image_store_put"):
+                return self.image_store.put(artifact_key, image_bytes)
+            
+        except GenerationError:
+            raise
+        except Exception as e:
+            raise GenerationError(f"Error generating image: {str(e)}")
+
+
+# Submit the generation of `artifacts` (default: all of them) to `executor`. Returns
+# {future: [artifacts it produces]} and the future of the LinkedIn style guide (None without
+# slides); slides follow `style_guide` if given. `on_text(artifact, text)` receives streamed text.
+# Each task runs in a span named after what it produces, under the caller's current span
+def submit_artifacts(generator, executor, topic, persona, tone, artifacts=None, style_guide=None,
+                     on_text=None, fresh=False, variants=1):
+    artifacts = ARTIFACTS if artifacts is None else artifacts
+    futures = {}
+    style_guide_future = None
+
+    def submit(name, fn, *args):
+        def task():
+            with span(name):
+                return fn(*args)
+        return executor.submit(in_current_context(task))
+
+    for platform in ("linkedin", "twitter", "whatsapp"):
+        if f"{platform}_text" in artifacts:
+            stream_to = None
+            if on_text is not None:
+                stream_to = lambda text, artifact=f"{platform}_text": on_text(artifact, text)
+            if variants > 1:
+                future = submit(f"{platform}_text", generator.generate_text_variants, topic, persona, tone, platform, variants, stream_to, fresh)
+            else:
+                future = submit(f"{platform}_text", generator.generate_text_content, topic, persona, tone, platform, stream_to, fresh)
+            futures[future] = [f"{platform}_text"]
+
+    # Twitter uses the WhatsApp image logic, so both share one generated image
+    shared_image = [artifact for artifact in ("twitter_image", "whatsapp_image") if artifact in artifacts]
+    if shared_image:
+        futures[submit("shared_image", generator.generate_image, topic, "whatsapp", None, fresh)] = shared_image
+
+    slides = [artifact for artifact in artifacts if artifact.startswith("linkedin_slide_")]
+    if slides:
+        if style_guide:
+            # Slides of an existing carousel keep following its style guide
+            style_guide_future = Future()
+            style_guide_future.set_result(style_guide)
+        else:
+            # Submitted before the slides so the slides waiting on it can never starve the pool
+            style_guide_future = submit("linkedin_style_guide", generator.generate_linkedin_style_guide, topic, fresh)
+
+        # LinkedIn slides wait for the shared style guide, then generate concurrently
+        def generate_linkedin_slide(slide_number):
+            with span("wait_style_guide"):
+                style_guide_text = style_guide_future.result()
+            return generator.generate_image(f"{topic} - slide {slide_number}/3", "linkedin", style_guide_text, fresh)
+
+        for artifact in slides:
+            futures[submit(artifact, generate_linkedin_slide, int(artifact[-1]))] = [artifact]
+
+    return futures, style_guide_future
+
+
+# The ArtifactResults of a finished future of submit_artifacts
+def artifact_results(artifacts, future):
+    try:
+        value = future.result()
+    except GenerationError as e:
+        return [ArtifactResult(artifact, error=e) for artifact in artifacts]
+    if isinstance(value, list):
+        return [ArtifactResult(artifact, text=value[0], variants=value) for artifact in artifacts]
+    return [
+        ArtifactResult(artifact, text=value) if artifact.endswith("_text") else ArtifactResult(artifact, image_path=value)
+        for artifact in artifacts
+    ]
+
+
+# The posts of `results` (ArtifactResults with variants) with their variants ranked again
+# against the best versions of the other platforms' posts, so a version repeating them ranks
+# lower; versions that pass the post checks stay ahead of those that don't
+def rank_against_each_other(results):
+    best = {result.artifact: result.text for result in results}
+    ranked_results = []
+    for result in results:
+        platform = result.artifact[:-len("_text")]
+        others = [text for artifact, text in best.items() if artifact != result.artifact]
+        validator = post_validator(platform)
+        ranked = rank_variants(platform, result.variants, others)
+        ranked.sort(key=lambda text: bool(validator.check(text)))
+        ranked_results.append(result._replace(text=ranked[0], variants=ranked))
+    return ranked_results
+
+
+class GenerationRun:
+    """A ContentRequest being generated: its events as they happen, then the style guide it used"""
+
+    # `usage` is the ledger of this run alone; the generator's own ledger covers all its runs
+    def __init__(self, generator, request, stream=False):
+        self.request = request
+        self.usage = UsageLedger()
+        self._events = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=MAX_GENERATION_WORKERS)
+        on_text = (lambda artifact, text: self._events.put(TextDelta(artifact, text))) if stream else None
+        try:
+            # Each future maps to the artifacts it produces; its task records into this run's ledger
+            with recording_into(self.usage):
+                self._futures, self._style_guide_future = submit_artifacts(
+                    generator, self._executor, request.topic, request.persona, request.tone, request.artifacts,
+                    request.style_guide, on_text, request.fresh, request.variants
+                )
+        except BaseException:
+            self.close()
+            raise
+        for future in self._futures:
+            future.add_done_callback(self._events.put)
+
+    # Lists of the events (TextDelta and ArtifactResult) since the previous list, until every
+    # artifact is done; a slow consumer gets fewer, longer lists instead of falling behind.
+    # Posts in several variants are held back until every post of the run is done, to be
+    # ranked against each other. Stopping early cancels the calls that haven't started
+    def batches(self):
+        pending = set(self._futures)
+        pending_posts = {future for future, artifacts in self._futures.items() if any(artifact.endswith("_text") for artifact in artifacts)}
+        held = []
+        try:
+            while pending:
+                batch = [self._events.get()]
+                while not self._events.empty():
+                    batch.append(self._events.get_nowait())
+
+                events = []
+                for event in batch:
+                    if isinstance(event, TextDelta):
+                        events.append(event)
+                        continue
+                    pending.discard(event)
+                    pending_posts.discard(event)
+                    # Calls cancelled by close() produced nothing
+                    if not event.cancelled():
+                        for result in artifact_results(self._futures[event], event):
+                            (held if result.variants is not None else events).append(result)
+                if held and not pending_posts:
+                    with span("rank_posts", posts=len(held)):
+                        events.extend(rank_against_each_other(held))
+                    held = []
+                yield events
+        finally:
+            self.close()
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+    # The carousel's style guide once the slides are done (None without slides)
+    def style_guide(self):
+        future = self._style_guide_future
+        return None if future is None or future.cancelled() else future.result()
+
+    # Don't keep anyone waiting on calls nobody will use; in-flight ones finish in the background
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,176 @@
+"""
+Background generation jobs
+
+A "Generate Content" run is submitted as a job to a process-wide pool of
+runner threads instead of running on the Streamlit script thread, so reruns,
+widget interactions, reconnects and tab switches neither abort nor restart
+it, and one server keeps many sessions' runs in flight without tying up their
+script threads. Sessions keep only the job ID and poll the job for the
+artifacts finished so far; finished jobs are kept for JOB_TTL seconds, so a
+reloaded page can pick its run up again.
+"""
+
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from openai_transport import connection_savings
+from generation import TextDelta
+from tracing import trace, write_trace
+
+# Jobs generating at the same time in this process (each fans out to its own API calls);
+# jobs beyond it wait in the queue
+MAX_RUNNING_JOBS = int(os.environ.get("MAX_RUNNING_JOBS", "16"))
+
+# Seconds a finished job (and what it generated) can still be picked up
+JOB_TTL = int(os.environ.get("JOB_TTL", "3600"))
+
+
+class Job:
+    """A ContentRequest generating in the background, and what it has produced so far"""
+
+    # `details` is kept for the submitter, e.g. to restore its session from the job
+    def __init__(self, generator, request, stream=False, details=None, on_done=None):
+        self.job_id = uuid.uuid4().hex
+        self.generator = generator
+        self.request = request
+        self.stream = stream
+        self.details = details
+        self.on_done = on_done
+        self.status = "queued"
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._run = None
+        self._results = {}  # artifact -> ArtifactResult
+        self._partial_text = {}  # artifact -> text streamed so far
+        self._first_token_seconds = {}
+        self._style_guide = None
+        self._metadata = {}
+
+    def done(self):
+        return self.status in ("done", "cancelled", "failed")
+
+    # Stop the job: queued calls are dropped, calls in flight finish but are not waited for
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            run = self._run
+        if run is not None:
+            run.close()
+
+    # A consistent copy of the job's progress
+    def snapshot(self):
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "done": self.done(),
+                "artifacts": list(self.request.artifacts) if self.request.artifacts is not None else None,
+                "results": dict(self._results),
+                "partial_text": dict(self._partial_text),
+                "style_guide": self._style_guide,
+                "metadata": {**self._metadata, "first_token_seconds": dict(self._first_token_seconds)},
+            }
+
+    def _execute(self):
+        if self._cancelled.is_set():
+            self._finish("cancelled", {})
+            return
+
+        started = time.perf_counter()
+        status = "done"
+        metadata = {}
+        run = None
+        # However the run or the bookkeeping after it fails, the job ends, so pollers stop
+        try:
+            connections_before = self.generator.transport.stats.snapshot()
+            with trace("generate", topic=self.request.topic) as run_trace:
+                try:
+                    run = self.generator.start(self.request, self.stream)
+                    with self._lock:
+                        self._run = run
+                        self.status = "running"
+                    try:
+                        for batch in run.batches():
+                            self._apply(batch, time.perf_counter() - started)
+                            if self._cancelled.is_set():
+                                status = "cancelled"
+                                break
+                        else:
+                            style_guide = run.style_guide()
+                            with self._lock:
+                                self._style_guide = style_guide
+                    finally:
+                        run.close()
+                except Exception as e:
+                    status = "failed"
+                    metadata["error"] = f"{type(e).__name__}: {e}"
+
+            # Recorded even when the job is cancelled, since what was sent is paid for
+            metadata["usage"] = run.usage.summary() if run is not None else {}
+            metadata["seconds"] = time.perf_counter() - started
+            metadata["connections"] = connection_savings(connections_before, self.generator.transport.stats.snapshot())
+            metadata["trace"] = run_trace.spans()
+            metadata["trace_file"] = write_trace(run_trace)
+        except Exception as e:
+            status = "failed"
+            metadata.setdefault("error", f"{type(e).__name__}: {e}")
+        finally:
+            self._finish(status, metadata)
+
+    def _apply(self, batch, elapsed):
+        with self._lock:
+            for event in batch:
+                if isinstance(event, TextDelta):
+                    self._first_token_seconds.setdefault(event.artifact, elapsed)
+                    self._partial_text[event.artifact] = event.text
+                    continue
+                self._partial_text.pop(event.artifact, None)
+                if event.text is not None:
+                    self._first_token_seconds.setdefault(event.artifact, elapsed)
+                self._results[event.artifact] = event
+
+    def _finish(self, status, metadata):
+        with self._lock:
+            self._metadata = metadata
+            self._partial_text.clear()
+            self._run = None
+            self.status = status
+            self.finished_at = time.time()
+        if self.on_done is not None:
+            self.on_done(self)
+
+
+class JobQueue:
+    """Process-wide pool of runner threads and the jobs submitted to it, by ID"""
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    # Queue `request` for `generator`; `on_done(job)` is called on the runner thread once it ends
+    def submit(self, generator, request, stream=False, details=None, on_done=None):
+        job = Job(generator, request, stream, details, on_done)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        self._executor.submit(job._execute)
+        return job
+
+    # The job with this ID, or None if it is unknown or expired
+    def get(self, job_id):
+        if not job_id:
+            return None
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        expired = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < expired]:
+            del self._jobs[job_id]
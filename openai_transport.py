@@ -0,0 +1,350 @@
+"""
+Pooled HTTP transport for the OpenAI API
+
+One requests.Session with a sized keep-alive connection pool and connect/read
+timeouts, shared by every chat and image call so TCP+TLS handshakes to the API
+are paid once per connection instead of once per request.
+
+requests (and urllib3) are imported when the first request is sent, not when
+the app starts, so they don't add to the time until the first page paint.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+
+from rate_limiter import RateLimiter
+from cassette import CASSETTE_MODE, CASSETTE_PATH, Cassette, CassetteAdapter
+from tracing import span
+
+# Base URL of the API (can point at a proxy or a local stand-in server)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+# Seconds to establish a connection / to wait for response bytes (DALL-E HD can take ~20s)
+CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("OPENAI_READ_TIMEOUT", "120"))
+
+# Keep-alive connections kept open per host, shared by all sessions of the process
+POOL_SIZE = int(os.environ.get("OPENAI_POOL_SIZE", "32"))
+
+# Seconds a successful response stays shareable with identical requests after it completes.
+# Off by default: the text prompts sample at temperature 1.0, so a later click with the
+# same inputs is expected to produce a new variation rather than replay the last one
+SINGLE_FLIGHT_TTL = float(os.environ.get("OPENAI_SINGLE_FLIGHT_TTL", "0"))
+
+
+class ConnectionStats:
+    """Thread-safe counters for requests sent, connections opened and rate limiting"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.handshake_seconds = 0.0
+        self.coalesced = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self, seconds):
+        with self._lock:
+            self.connections += 1
+            self.handshake_seconds += seconds
+
+    def record_coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_throttled(self, seconds):
+        with self._lock:
+            self.throttled_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "handshake_seconds": self.handshake_seconds,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "throttled_seconds": self.throttled_seconds,
+            }
+
+
+# Summarise the connection reuse between two ConnectionStats snapshots
+def connection_savings(before, after):
+    requests_sent = after["requests"] - before["requests"]
+    connections = after["connections"] - before["connections"]
+    reused = max(requests_sent - connections, 0)
+
+    # Average handshake cost over the lifetime of the process, so a run that opened
+    # no connection at all still gets an estimate of what it saved
+    avg_handshake = after["handshake_seconds"] / after["connections"] if after["connections"] else 0.0
+    return {
+        "requests": requests_sent,
+        "connections": connections,
+        "reused": reused,
+        "handshake_seconds": after["handshake_seconds"] - before["handshake_seconds"],
+        "saved_seconds": reused * avg_handshake,
+        "coalesced": after["coalesced"] - before["coalesced"],
+        "retries": after["retries"] - before["retries"],
+        "throttled_seconds": after["throttled_seconds"] - before["throttled_seconds"],
+    }
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one and share its result
+
+    The first caller for a key runs the function; callers arriving while it is in
+    flight (or within `ttl` seconds after it succeeded) get the same result.
+    """
+
+    def __init__(self, ttl=SINGLE_FLIGHT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> (Future, expiry time or None while in flight)
+
+    def do(self, key, fn, keep=lambda result: True, on_shared=None):
+        with self._lock:
+            self._prune()
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                future = Future()
+                self._flights[key] = (future, None)
+            else:
+                future = flight[0]
+
+        if not leader:
+            if on_shared:
+                on_shared()
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._flights.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if self.ttl > 0 and keep(result):
+                self._flights[key] = (future, time.monotonic() + self.ttl)
+            else:
+                self._flights.pop(key, None)
+        future.set_result(result)
+        return result
+
+    # Drop completed flights whose sharing window has passed (caller holds the lock)
+    def _prune(self):
+        now = time.monotonic()
+        expired = [key for key, (_, expiry) in self._flights.items() if expiry is not None and expiry <= now]
+        for key in expired:
+            del self._flights[key]
+
+
+# Hash of an API key, used wherever state is kept per key (rate limits, shared responses)
+def api_key_scope(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+# Canonical identity of an API request; the key is hashed so identical payloads from
+# different API keys never share a response
+def request_key(path, payload, api_key):
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
+    return hashlib.sha256(f"{api_key_scope(api_key)}\n{path}\n{canonical}".encode()).hexdigest()
+
+
+# Connection pool classes whose connections time their TCP+TLS setup into `stats`
+def _timed_pool_classes(stats):
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            stats.record_connection(time.perf_counter() - start)
+
+    class TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            stats.record_connection(time.perf_counter() - start)
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    return {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+
+# A requests adapter whose connection pools time their connections into `stats`
+def _timed_adapter(stats, **kwargs):
+    from requests.adapters import HTTPAdapter
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = _timed_pool_classes(stats)
+
+    return TimedHTTPAdapter(**kwargs)
+
+
+class OpenAITransport:
+    """Process-wide, thread-safe HTTP client for the OpenAI REST API"""
+
+    # With a cassette (see cassette.py) the responses are recorded to it or replayed from it
+    def __init__(self, base_url=OPENAI_BASE_URL, pool_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 cassette_path=CASSETTE_PATH, cassette_mode=CASSETTE_MODE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.stats = ConnectionStats()
+        self.flights = SingleFlight()
+        self.limiter = RateLimiter()
+        self.cassette = Cassette(cassette_path, cassette_mode) if cassette_path and cassette_mode else None
+
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    # The requests.Session, created on first use
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+
+                    session = requests.Session()
+                    adapter = _timed_adapter(
+                        self.stats,
+                        pool_connections=4,  # API host + image CDN hosts
+                        pool_maxsize=self.pool_size,
+                    )
+                    if self.cassette is not None:
+                        adapter = CassetteAdapter(self.cassette, adapter)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update({"Connection": "keep-alive"})
+                    self._session = session
+        return self._session
+
+    # POST a JSON payload to an API path such as "/chat/completions"; identical
+    # requests in flight at the same time (from any session) share one call
+    def post_json(self, path, payload, api_key):
+        return self.flights.do(
+            request_key(path, payload, api_key),
+            lambda: self._post_json(path, payload, api_key),
+            keep=lambda response: response.status_code == 200,
+            on_shared=self.stats.record_coalesced,
+        )
+
+    # POST a JSON payload with "stream": true; the caller reads it with iter_sse_events().
+    # Streams are never coalesced since a response body can only be consumed once
+    def stream_json(self, path, payload, api_key):
+        return self._post_json(path, {**payload, "stream": True}, api_key, stream=True)
+
+    # Send a request once the rate limiter allows it, retrying throttled and transient failures.
+    # The last response is returned as is when it can't be retried any more
+    def _post_json(self, path, payload, api_key, stream=False):
+        import requests
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+        # Ensure the payload is properly encoded as JSON with ASCII only
+        json_payload = json.dumps(payload, ensure_ascii=True)
+        scope = api_key_scope(api_key)
+        session = self.session
+
+        attempt = 0
+        while True:
+            wait = self.limiter.reserve(scope, path, payload)
+            if wait > 0:
+                with span("rate_limit_wait"):
+                    time.sleep(wait)
+                self.stats.record_throttled(wait)
+
+            self.stats.record_request()
+            try:
+                # Until the response headers for streams, the whole response otherwise
+                with span("http_request", path=path, attempt=attempt) as attributes:
+                    response = session.post(
+                        f"{self.base_url}{path}",
+                        headers=headers,
+                        data=json_payload,
+                        timeout=self.timeout,
+                        stream=stream,
+                    )
+                    attributes["status"] = response.status_code
+            except requests.ConnectionError:
+                response = None
+                delay = self.limiter.retry_delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                self.limiter.update(scope, path, payload, response.headers)
+                delay = self.limiter.retry_delay(attempt, response)
+                if delay is None:
+                    return response
+                response.close()
+
+            attempt += 1
+            self.stats.record_retry()
+            if response is not None and response.status_code == 429:
+                # Hold back the other requests for this model too; the reservation before the next attempt does the waiting
+                self.limiter.pause(scope, path, payload, delay)
+            else:
+                self.stats.record_throttled(delay)
+                with span("retry_backoff"):
+                    time.sleep(delay)
+
+    # Download a URL (e.g. a generated image on the CDN) over the same pool in chunks, aborting as soon as the body grows past `max_bytes`
+    def download(self, url, max_bytes, chunk_size=64 * 1024):
+        self.stats.record_request()
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+
+            content_length = response.headers.get("Content-Length")
+            if content_length and int(content_length) > max_bytes:
+                raise ValueError(f"Download of {content_length} bytes exceeds the {max_bytes} byte limit")
+
+            chunks = []
+            received = 0
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ValueError(f"Download exceeds the {max_bytes} byte limit")
+                chunks.append(chunk)
+            return b"".join(chunks)
+
+
+# Yield the JSON data of each server-sent event of a streaming response until [DONE]
+def iter_sse_events(response):
+    # chunk_size=None hands over each chunk as soon as it arrives instead of
+    # waiting for a fixed number of bytes, which would delay the first tokens
+    for line in response.iter_lines(chunk_size=None):
+        if not line or line.startswith(b":"):
+            continue
+        if line.startswith(b"data:"):
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                return
+            yield json.loads(data)
@@ -0,0 +1,166 @@
+"""
+Prompt templates for text and image generation
+
+Personas, tones, platform settings and the prompt templates live as data in
+the prompts/ directory and are loaded once per process. Templates are
+dedented and minified when loaded (indentation and blank-line runs cost
+tokens but carry no meaning for the model). Rendered prompts are memoized
+and carry their token count.
+
+Add a persona or tone by adding an entry to prompts/personas.json or
+prompts/tones.json; it shows up in the app and is used in the prompts.
+"""
+
+import os
+import re
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+# Directory with the persona, tone and platform data and the prompt templates
+PROMPTS_DIR = os.environ.get("PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))
+
+# Rendered prompts kept per distinct set of inputs
+PROMPT_CACHE_SIZE = 256
+
+# Model whose tokenizer is used for token counts
+TOKENIZER_MODEL = "gpt-4o"
+
+# What a free-text persona from the app is described as in the prompts
+CUSTOM_PERSONA_STYLE = {
+    "structure": "tailored to the subject with distinctive viewpoint",
+    "signature": "uses specialized language and perspectives specific to their expertise",
+    "examples": ["From my perspective:", "Here's what I've observed:", "My take on this:"],
+    "data_use": "uses data selectively to support key points when relevant"
+}
+DEFAULT_TONE = "Professional"
+
+# A rendered prompt: system and user message (system is None for image prompts),
+# the completion budget (None for image prompts) and the prompt's token count
+RenderedPrompt = namedtuple("RenderedPrompt", ["system", "user", "max_tokens", "tokens"])
+
+# Word, number and punctuation runs, each with its leading space, roughly as BPE tokenizers split text
+_TOKEN_PIECES = re.compile(r" ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+")
+
+
+# Strip the indentation, trailing spaces and repeated blank lines from a template
+def minify(text):
+    lines = []
+    for line in text.strip().splitlines():
+        line = line.strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+# The tokenizer of TOKENIZER_MODEL if tiktoken and its encoding files are available, else None
+@lru_cache(maxsize=1)
+def _tokenizer():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except Exception:
+        return None
+
+
+# Number of tokens in `text`: exact with tiktoken installed, otherwise an estimate that is
+# usually within ~10% for English prose
+def count_tokens(text):
+    if not text:
+        return 0
+    tokenizer = _tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text))
+    return sum(1 + len(piece) // 8 for piece in _TOKEN_PIECES.findall(text))
+
+
+# Whether count_tokens is exact (tiktoken) rather than an estimate
+def exact_token_counts():
+    return _tokenizer() is not None
+
+
+# Tokens of a chat request's messages, including the per-message framing
+def count_message_tokens(*contents):
+    return sum(count_tokens(content) + 4 for content in contents if content) + 3
+
+
+class PromptRegistry:
+    """Personas, tones and minified prompt templates loaded from a prompts directory"""
+
+    def __init__(self, directory=PROMPTS_DIR):
+        self.directory = directory
+        self.personas = self._load_json("personas.json")
+        self.tones = self._load_json("tones.json")
+        self.platforms = self._load_json("platforms.json")
+        self.banned_phrases = self._load_json("banned_phrases.json")
+        self.templates = {
+            os.path.splitext(name)[0]: minify(self._read(name))
+            for name in sorted(os.listdir(directory)) if name.endswith(".txt")
+        }
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+            return f.read()
+
+    def _load_json(self, name):
+        return json.loads(self._read(name))
+
+    # Fill a template; values are inserted as-is, so braces in a topic are safe
+    def render(self, template, **values):
+        return self.templates[template].format_map(values)
+
+    # Style of a persona; a free-text custom persona becomes its own voice
+    def persona_style(self, persona):
+        return self.personas.get(persona) or {"voice": persona, **CUSTOM_PERSONA_STYLE}
+
+    def tone_style(self, tone):
+        return self.tones.get(tone) or self.tones[DEFAULT_TONE]
+
+    # Chat prompt for a post on `platform` ("linkedin", "twitter" or "whatsapp")
+    @lru_cache(maxsize=PROMPT_CACHE_SIZE)
+    def text_prompt(self, topic, persona, tone, platform):
+        settings = self.platforms[platform]
+        values = {
+            "topic": topic,
+            "persona": persona,
+            "tone": tone,
+            "persona_style": self.persona_style(persona),
+            "tone_style": self.tone_style(tone),
+        }
+        values["content_guidelines"] = self.render("content_guidelines", **values)
+
+        system = self.templates["text_system"]
+        user = self.render(os.path.splitext(settings["template"])[0], **values)
+        return RenderedPrompt(system, user, settings["max_tokens"], count_message_tokens(system, user))
+
+    # Short chat prompt asking to fix `problems` (one per line) in a generated post, instead of
+    # generating it again from the full prompt
+    def fix_up_prompt(self, platform, post, problems, max_tokens):
+        system = self.templates["text_system"]
+        user = self.render("fix_up", platform=platform, post=post, problems="\n".join(f"- {problem}" for problem in problems))
+        return RenderedPrompt(system, user, max_tokens, count_message_tokens(system, user))
+
+    # Chat prompt for the visual style guide shared by the LinkedIn slides
+    @lru_cache(maxsize=PROMPT_CACHE_SIZE)
+    def style_guide_prompt(self, main_topic):
+        system = self.templates["style_guide_system"]
+        user = self.render("style_guide", main_topic=main_topic)
+        return RenderedPrompt(system, user, 300, count_message_tokens(system, user))
+
+    # Image prompt for LinkedIn slide 1, 2 or 3 of a carousel following `style_guide`
+    @lru_cache(maxsize=PROMPT_CACHE_SIZE)
+    def slide_prompt(self, main_topic, slide_position, style_guide):
+        template = f"linkedin_slide_{slide_position}" if slide_position in ("1", "2") else "linkedin_slide_3"
+        common_styling = self.render("linkedin_slide_styling", style_guide=style_guide)
+        user = self.render(template, main_topic=main_topic, common_styling=common_styling)
+        return RenderedPrompt(None, user, None, count_tokens(user))
+
+    # Image prompt for the single image shared by the Twitter and WhatsApp posts
+    @lru_cache(maxsize=PROMPT_CACHE_SIZE)
+    def image_prompt(self, topic, style):
+        user = self.render("whatsapp_image", topic=topic, style=style)
+        return RenderedPrompt(None, user, None, count_tokens(user))
+
+
+# Loaded once per process and shared by every session and worker thread
+PROMPTS = PromptRegistry()
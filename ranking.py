@@ -0,0 +1,97 @@
+"""
+Local ranking of text variants
+
+Several versions of a post are requested in one chat call (the API's `n`), so
+the prompt is paid for once, and ranked here with cheap heuristics instead of
+another model call:
+
+- fit: a tweet within its length limit, a WhatsApp message that is short and
+  uses its *bold*, _italic_ and list formatting with frequent line breaks, a
+  LinkedIn post of 100-200 words in short paragraphs with a short hook
+- completeness: a post cut off by the token budget ranks last
+- repetition: word trigrams shared with the posts for the other platforms
+"""
+
+import re
+
+from prompt_registry import PROMPTS
+from validators import tweet_length
+
+_WORD = re.compile(r"[a-z0-9']+")
+_WHATSAPP_MARKERS = re.compile(r"\*[^*\n]+\*|_[^_\n]+_|^\s*(?:[-•✓✔]|\d+[.)])\s", re.M)
+# What a finished post ends with: sentence punctuation, a closing quote or bracket, formatting,
+# a hashtag or an emoji
+_COMPLETE_ENDING = re.compile(r"(?:[.!?)\]\"'*_]|#\w+|[^\x00-\x7f])\s*$")
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(text):
+    words = _words(text)
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+# Share of the word trigrams of `text` that also occur in `other` (0 = nothing in common)
+def overlap(text, other):
+    trigrams = _trigrams(text)
+    if not trigrams:
+        return 0.0
+    return len(trigrams & _trigrams(other)) / len(trigrams)
+
+
+# 1.0 inside [low, high], falling linearly to 0 at twice the distance outside it
+def _within(value, low, high):
+    if value < low:
+        return max(0.0, value / low)
+    if value > high:
+        return max(0.0, 1 - (value - high) / high)
+    return 1.0
+
+
+# How well `text` fits the platform's format, from 0 to 1. The hard limits are the "rules" of
+# the platform in prompts/platforms.json, the ones the post checks enforce
+def platform_fit(platform, text):
+    rules = PROMPTS.platforms[platform].get("rules", {})
+    max_words = rules.get("max_words")
+    if max_words is not None and len(_words(text)) > max_words:
+        return 0.0
+    lines = [line for line in text.splitlines() if line.strip()]
+    if platform == "twitter":
+        # Over the limit the tweet can't be posted as it is; counted the way Twitter counts it
+        max_chars = rules.get("max_chars", 280)
+        length = tweet_length(text)
+        return _within(length, max_chars / 2, max_chars) if length <= max_chars else 0.0
+    if platform == "whatsapp":
+        markers = len(_WHATSAPP_MARKERS.findall(text))
+        long_lines = sum(len(line) > 160 for line in lines)
+        return (
+            min(markers, 4) / 4
+            + min(len(lines), 6) / 6 * (1 - long_lines / max(len(lines), 1))
+            + _within(len(_words(text)), 30, 100)
+        ) / 3
+    # LinkedIn: the first line is what shows before "see more"
+    paragraphs = [paragraph for paragraph in re.split(r"\n\s*\n", text) if paragraph.strip()]
+    hook = 1.0 if lines and len(lines[0]) <= 150 else 0.5
+    return (_within(len(_words(text)), 100, 200) + min(len(paragraphs), 5) / 5 + hook) / 3
+
+
+def looks_complete(text):
+    return bool(_COMPLETE_ENDING.search(text))
+
+
+# Higher is better: the platform fit, minus a cut-off ending and the largest overlap with `others`
+def score_variant(platform, text, others=()):
+    score = platform_fit(platform, text)
+    if not looks_complete(text):
+        score -= 0.5
+    if others:
+        score -= max(overlap(text, other) for other in others)
+    return score
+
+
+# `variants` best first (ties keep the API's order)
+def rank_variants(platform, variants, others=()):
+    others = [other for other in others if other]
+    return sorted(variants, key=lambda text: -score_variant(platform, text, others))
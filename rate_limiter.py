@@ -0,0 +1,193 @@
+"""
+Client-side rate limiting for the OpenAI API
+
+Token buckets per API key and model keep the requests, tokens and images sent
+per minute just under the organisation's limits. The buckets start from the
+configured limits and follow the x-ratelimit-* headers of every response, so
+they converge on the real limits and remaining budget. Throttled (429) and
+transient (5xx) responses are retried after Retry-After or a jittered
+exponential backoff.
+"""
+
+import os
+import re
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+# Limits assumed until the API reports the real ones in its response headers
+REQUESTS_PER_MINUTE = float(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", "500"))
+TOKENS_PER_MINUTE = float(os.environ.get("OPENAI_TOKENS_PER_MINUTE", "30000"))
+IMAGES_PER_MINUTE = float(os.environ.get("OPENAI_IMAGES_PER_MINUTE", "50"))
+
+# Attempts after the first one, and the backoff between them (seconds)
+MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Responses worth sending again: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Durations in x-ratelimit-reset-* headers look like "1s", "6m0s" or "120ms"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+# Seconds in a duration such as "1m30.5s", or None if it can't be parsed
+def parse_duration(value):
+    parts = _DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+# Seconds the server asked us to wait (retry-after-ms, then Retry-After), or None
+def retry_after_seconds(headers):
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+# Tokens a chat request counts against the TPM limit: ~4 characters per prompt token
+# plus the completion budget, which OpenAI reserves up front
+def estimate_tokens(payload):
+    characters = sum(len(str(message.get("content", ""))) for message in payload.get("messages", []))
+    return characters // 4 + payload.get("max_tokens", 0) * payload.get("n", 1)
+
+
+class TokenBucket:
+    """Per-minute budget that refills continuously
+
+    Reservations are granted in arrival order by letting the level go negative;
+    the caller then waits until the refill has paid off its share of the debt.
+    A limit of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity <= 0:
+            return
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    # Take `amount` from the bucket and return the seconds to wait before using it
+    def reserve(self, amount, now):
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return max(-self.level, 0) * 60 / self.capacity
+
+    # Adopt the limit and remaining budget reported by the API
+    def sync(self, limit, remaining, now):
+        self._refill(now)
+        if limit:
+            if self.capacity <= 0:
+                # Previously unlimited: start from a full bucket
+                self.level = limit
+                self._updated = now
+            self.capacity = limit
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+
+    # Hold back everything until `seconds` from now
+    def pause(self, seconds, now):
+        if self.capacity <= 0:
+            return
+        self._refill(now)
+        self.level = min(self.level, -seconds * self.capacity / 60)
+
+
+class RateLimiter:
+    """Thread-safe scheduler for the requests of all sessions, per API key and model"""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 images_per_minute=IMAGES_PER_MINUTE, max_retries=MAX_RETRIES):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.images_per_minute = images_per_minute
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._buckets = {}  # (scope, model) -> {"requests": TokenBucket, "tokens": TokenBucket}
+
+    def _buckets_for(self, scope, path, payload):
+        key = (scope, payload.get("model"))
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            # Image models are limited in images per minute, chat models in requests and tokens
+            if path.startswith("/images"):
+                buckets = {"requests": TokenBucket(self.images_per_minute)}
+            else:
+                buckets = {
+                    "requests": TokenBucket(self.requests_per_minute),
+                    "tokens": TokenBucket(self.tokens_per_minute),
+                }
+            self._buckets[key] = buckets
+        return buckets
+
+    # Reserve the budget of a request and return the seconds to wait before sending it
+    def reserve(self, scope, path, payload):
+        with self._lock:
+            now = time.monotonic()
+            buckets = self._buckets_for(scope, path, payload)
+            amounts = {"requests": payload.get("n", 1) if path.startswith("/images") else 1}
+            if "tokens" in buckets:
+                amounts["tokens"] = estimate_tokens(payload)
+            return max(buckets[name].reserve(amount, now) for name, amount in amounts.items())
+
+    # Follow the x-ratelimit-* headers of a response
+    def update(self, scope, path, payload, headers):
+        with self._lock:
+            now = time.monotonic()
+            for name, bucket in self._buckets_for(scope, path, payload).items():
+                try:
+                    limit = float(headers.get(f"x-ratelimit-limit-{name}") or 0)
+                    remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                    bucket.sync(limit, float(remaining) if remaining is not None else None, now)
+                except ValueError:
+                    continue
+
+    # Seconds to wait before retry number `attempt` (0-based), or None if `response` must not be retried
+    def retry_delay(self, attempt, response=None):
+        if attempt >= self.max_retries:
+            return None
+        if response is not None:
+            if response.status_code not in RETRY_STATUSES:
+                return None
+            # An exhausted quota or billing limit doesn't recover by waiting
+            if response.status_code == 429 and "insufficient_quota" in response.text:
+                return None
+
+        # Full jitter keeps concurrent retries from hitting the API in lockstep
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        if response is not None:
+            server_delay = retry_after_seconds(response.headers)
+            if server_delay is None and response.status_code == 429:
+                server_delay = max(
+                    (parse_duration(response.headers.get(f"x-ratelimit-reset-{name}")) or 0)
+                    for name in ("requests", "tokens")
+                ) or None
+            if server_delay is not None:
+                delay = min(server_delay, BACKOFF_MAX) + random.uniform(0, BACKOFF_BASE / 4)
+        return delay
+
+    # Make every request for the model of a throttled response wait `seconds` as well
+    def pause(self, scope, path, payload, seconds):
+        with self._lock:
+            now = time.monotonic()
+            for bucket in self._buckets_for(scope, path, payload).values():
+                bucket.pause(seconds, now)
@@ -0,0 +1,105 @@
+"""
+Persistent cache for chat completion responses
+
+Responses are stored in a SQLite database keyed by the model, messages and
+sampling parameters of the request, expire after a TTL and are evicted least
+recently used first once the cache grows past its byte budget.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Where on-disk caches live (shared with the other local stores of the app)
+CONTENT_CACHE_DIR = os.environ.get(
+    "CONTENT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai-content-generator")
+)
+
+# Seconds a cached response stays valid and the total size of stored responses
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+class ResponseCache:
+    """Thread-safe SQLite cache of chat completion responses with TTL and LRU eviction"""
+
+    def __init__(self, directory=CONTENT_CACHE_DIR, ttl=RESPONSE_CACHE_TTL, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "responses.sqlite3")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    # Cache key of a chat completion payload: model, messages and every sampling parameter
+    @staticmethod
+    def key(payload):
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    # Return the cached response body for `key`, or None on a miss
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT body, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    # Store a response body and evict the least recently used entries over the byte budget
+    def put(self, key, response_data):
+        body = json.dumps(response_data, ensure_ascii=True)
+        size = len(body)
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, body, size, now, now)
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, old_size in self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed ASC"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= old_size
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
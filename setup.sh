@@ -3,6 +3,16 @@
 # Install Python dependencies
 pip install -r requirements.txt
 
+# Self-host the Poppins font (SIL Open Font License) used by assets/app.css
+mkdir -p assets/fonts
+for style in Light Regular Medium SemiBold Bold; do
+    if [ ! -f "assets/fonts/Poppins-$style.ttf" ]; then
+        curl -fsSL -o "assets/fonts/Poppins-$style.ttf" \
+            "https://github.com/google/fonts/raw/main/ofl/poppins/Poppins-$style.ttf" \
+            || echo "Could not download Poppins-$style.ttf; it is loaded from Google Fonts instead"
+    fi
+done
+
 # Make setup.sh executable
 chmod +x setup.sh
 
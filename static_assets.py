@@ -0,0 +1,130 @@
+"""
+Stylesheet, font and copy button served as cached static files
+
+The app's stylesheet (assets/app.css) and the self-hosted Poppins font (or,
+without the font files, an import of it from Google Fonts) are minified into
+STATIC_BUILD_DIR once per process and served by Streamlit's component file
+handler, which sends their real content types and Cache-Control: public
+(static serving sends CSS as text/plain with nosniff, which browsers refuse to
+apply). The stylesheet's file name carries its
+content hash, so browsers download it once per version, and every rerun only
+sends a one-line <style>@import</style> pointing at it.
+
+The copy button (assets/copy_button.html) is a component served from the same
+directory, so its page is cached too and no script is injected into the app.
+"""
+
+import os
+import re
+import hashlib
+import tempfile
+from functools import lru_cache
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from response_cache import CONTENT_CACHE_DIR
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# Where the minified assets are built and served from
+STATIC_BUILD_DIR = os.path.join(CONTENT_CACHE_DIR, "static")
+
+# Self-hosted font files in assets/fonts (fetched by setup.sh), by weight. Weights whose file
+# is missing (e.g. a deploy that didn't run setup.sh) are loaded from Google Fonts instead
+FONT_FAMILY = "Poppins"
+FONT_WEIGHTS = {"Light": 300, "Regular": 400, "Medium": 500, "SemiBold": 600, "Bold": 700}
+FONT_FORMATS = [("woff2", "woff2"), ("ttf", "truetype")]
+FONT_FALLBACK_URL = "https://fonts.googleapis.com/css2?family={family}:wght@{weights}&display=swap"
+
+# Serves everything in STATIC_BUILD_DIR; rendering it shows the copy button (index.html)
+_static_component = components.declare_component("static", path=STATIC_BUILD_DIR)
+
+
+# Remove comments and the whitespace the CSS grammar doesn't need (a space before ":"
+# can be a descendant combinator, so only the space after it goes)
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+# Drop indentation, blank lines and whole-line // comments; line breaks are kept, so
+# scripts relying on automatic semicolon insertion keep working
+def minify_html(page):
+    lines = (line.strip() for line in page.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+def _read(name, directory=ASSETS_DIR):
+    with open(os.path.join(directory, name), encoding="utf-8") as f:
+        return f.read()
+
+
+# Replace a file atomically and only if its content changed, so concurrent server
+# processes never serve a half-written asset
+def _write(path, data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return
+    except FileNotFoundError:
+        pass
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+# @font-face rules for the font files present in assets/fonts, copied next to the stylesheet,
+# after an @import of the missing weights from Google Fonts
+def _font_faces(source, target):
+    rules = []
+    missing = []
+    for style, weight in FONT_WEIGHTS.items():
+        for extension, font_format in FONT_FORMATS:
+            name = f"{FONT_FAMILY}-{style}.{extension}"
+            if os.path.exists(os.path.join(source, "fonts", name)):
+                with open(os.path.join(source, "fonts", name), "rb") as f:
+                    _write(os.path.join(target, "fonts", name), f.read())
+                rules.append(
+                    f"@font-face{{font-family:'{FONT_FAMILY}';font-style:normal;font-weight:{weight};"
+                    f"font-display:swap;src:local('{FONT_FAMILY} {style}'),local('{FONT_FAMILY}-{style}'),"
+                    f"url(fonts/{name}) format('{font_format}')}}"
+                )
+                break
+        else:
+            missing.append(weight)
+    if missing:
+        # @import has to come before every other rule of the stylesheet
+        url = FONT_FALLBACK_URL.format(family=FONT_FAMILY, weights=";".join(map(str, missing)))
+        rules.insert(0, f'@import url("{url}");')
+    return "".join(rules)
+
+
+# Build the minified stylesheet and the copy button page into STATIC_BUILD_DIR, once per
+# process; returns the stylesheet's file name
+@lru_cache(maxsize=1)
+def build_assets(source=ASSETS_DIR, target=STATIC_BUILD_DIR):
+    os.makedirs(os.path.join(target, "fonts"), exist_ok=True)
+    css = _font_faces(source, target) + minify_css(_read("app.css", source))
+    stylesheet = f"app.{hashlib.sha256(css.encode()).hexdigest()[:12]}.css"
+    _write(os.path.join(target, stylesheet), css)
+    _write(os.path.join(target, "index.html"), minify_html(_read("copy_button.html", source)).replace("__STYLESHEET__", stylesheet))
+    return stylesheet
+
+
+# Style the page with the cached stylesheet
+def inject_styles():
+    stylesheet = build_assets()
+    st.markdown(f'<style>@import url("component/{_static_component.name}/{stylesheet}");</style>', unsafe_allow_html=True)
+
+
+# A button that copies `text` to the clipboard
+def copy_button(text, label="Copy Text", key=None):
+    build_assets()
+    _static_component(text=text, label=label, key=key, default=None)
@@ -4,22 +4,16 @@ This file is a simple redirect to the main application (content_generator.py)
 """
 
 import streamlit as st
-import os
-import importlib.util
 
-# Import and run the main application
+# Import the main application once. Streamlit re-executes this file on every rerun,
+# but the imported module stays loaded, so reruns only call main()
 try:
-    # Get the path to content_generator.py
-    main_app_path = os.path.join(os.path.dirname(__file__), "content_generator.py")
-    
-    # Import the module
-    spec = importlib.util.spec_from_file_location("content_generator", main_app_path)
-    content_generator = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(content_generator)
-    
-    # Add a notice that we're using the redirected app
-    st.sidebar.info("This app is running from content_generator.py")
-    
+    from content_generator import main
 except Exception as e:
     st.error(f"Error loading the main application: {str(e)}")
-    st.error("Please use content_generator.py directly") 
\ No newline at end of file
+    st.error("Please use content_generator.py directly")
+else:
+    main()
+
+    # Add a notice that we're using the redirected app
+    st.sidebar.info("This app is running from content_generator.py")
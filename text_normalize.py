@@ -0,0 +1,148 @@
+"""
+Text normalization for prompts and generated posts
+
+One character-level mapping, applied in a single pass: typographic quotes,
+dashes and the ellipsis become their ASCII forms, exotic spaces become plain
+spaces, and invisible characters (zero-width spaces, byte order marks, soft
+hyphens, control characters other than tab and line breaks) are removed.
+Everything else is kept, emoji, accented letters and the zero-width joiner of
+emoji sequences included.
+
+ASCII text goes through str.translate, which has a fast path for it. In other
+text the characters models write most (curly quotes, dashes, the ellipsis,
+no-break spaces) are replaced with str.replace, which is much faster per
+character than any per-character callback, and what is left is scanned once
+for the other mapped characters (see benchmarks/text_normalization.py).
+
+Because the mapping is per character, chunks of a stream can be normalized as
+they arrive: StreamNormalizer only holds back the last grapheme of each chunk
+(which the next one may extend) and the half of a surrogate pair.
+"""
+
+import re
+import unicodedata
+
+# Typographic characters and their ASCII forms; None removes the character
+_MAPPING = {
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201b": "'", "\u2032": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u201f": '"', "\u2033": '"',
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2212": "-",
+    "\u2014": "--", "\u2015": "--",
+    "\u2026": "...",
+    "\u2028": "\n", "\u2029": "\n",
+    "\u00ad": None, "\u200b": None, "\u2060": None, "\ufeff": None,
+}
+_MAPPING.update({char: " " for char in "\u00a0\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u202f\u205f\u3000"})
+_MAPPING.update({chr(code): None for code in [*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), *range(0x7f, 0xa0)]})
+
+_TABLE = str.maketrans(_MAPPING)
+_MAPPED = re.compile("[" + "".join(re.escape(char) for char in _MAPPING) + "]")
+_REPLACEMENTS = {char: replacement or "" for char, replacement in _MAPPING.items()}
+_SURROGATES = re.compile("[\ud800-\udfff]")
+# Mapped characters common enough in generated text to replace one by one up front
+_COMMON = [(char, _REPLACEMENTS[char]) for char in "\u2019\u201c\u201d\u2014\u2013\u2026\u2018\u00a0"]
+
+_ZWJ = "\u200d"
+
+
+def _replace(match):
+    return _REPLACEMENTS[match.group()]
+
+
+# Join surrogate pairs (e.g. an emoji sent as a "\ud83d\udc4d" JSON escape that was split
+# across stream events) into their character and drop unpaired halves, which can't be encoded
+def _join_surrogates(text):
+    return text.encode("utf-16-le", "surrogatepass").decode("utf-16-le", "ignore")
+
+
+def normalize_text(text):
+    if not text:
+        return ""
+    if text.isascii():
+        return text.translate(_TABLE)
+    if _SURROGATES.search(text):
+        text = _join_surrogates(text)
+    for char, replacement in _COMMON:
+        if char in text:
+            text = text.replace(char, replacement)
+    if text.isascii():
+        return text.translate(_TABLE)
+    return _MAPPED.sub(_replace, text)
+
+
+# Whether `char` belongs to the grapheme before it: combining marks, variation selectors,
+# emoji skin tones, tag characters (flag sequences) and the zero-width joiner
+def is_grapheme_extender(char):
+    code = ord(char)
+    return code >= 0x300 and (
+        char == _ZWJ
+        or 0xFE00 <= code <= 0xFE0F
+        or 0x1F3FB <= code <= 0x1F3FF
+        or 0xE0020 <= code <= 0xE007F
+        or unicodedata.category(char) in ("Mn", "Me", "Mc")
+    )
+
+
+def _is_regional_indicator(char):
+    return 0x1F1E6 <= ord(char) <= 0x1F1FF
+
+
+# Split `text` into user-perceived characters (an approximation of the Unicode grapheme
+# cluster rules covering combining marks, emoji sequences and flags)
+def graphemes(text):
+    clusters = []
+    joined = False
+    for char in text:
+        if clusters and (
+            joined or is_grapheme_extender(char)
+            or (char == "\n" and clusters[-1] == "\r")
+            or (_is_regional_indicator(char) and len(clusters[-1]) == 1 and _is_regional_indicator(clusters[-1]))
+        ):
+            clusters[-1] += char
+        else:
+            clusters.append(char)
+        joined = char == _ZWJ
+    return clusters
+
+
+# Index where the last grapheme of `text` starts
+def _last_grapheme_start(text):
+    start = len(text) - 1
+    while start > 0 and (is_grapheme_extender(text[start]) or text[start - 1] == _ZWJ):
+        start -= 1
+    if _is_regional_indicator(text[start]):
+        # Flags are pairs of regional indicators: an odd one out starts a new flag
+        run = start
+        while run > 0 and _is_regional_indicator(text[run - 1]):
+            run -= 1
+        if (start - run) % 2:
+            start -= 1
+    return start
+
+
+class StreamNormalizer:
+    """normalize_text for streamed chunks: the joined output of feed() and flush() equals
+    normalize_text of the whole text, and never ends inside a grapheme or a surrogate pair"""
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, chunk):
+        text = self._pending + chunk
+        if not text:
+            return ""
+        if _SURROGATES.search(text):
+            # A high surrogate at the end waits for its other half
+            tail = text[-1] if "\ud800" <= text[-1] <= "\udbff" else ""
+            text = _join_surrogates(text[:len(text) - len(tail)]) + tail
+            if not text:
+                # Nothing but an unpaired low surrogate, which is dropped
+                self._pending = ""
+                return ""
+        cut = _last_grapheme_start(text)
+        self._pending = text[cut:]
+        return normalize_text(text[:cut])
+
+    def flush(self):
+        text, self._pending = self._pending, ""
+        return normalize_text(text)
@@ -0,0 +1,135 @@
+"""
+Per-run tracing of the generation stages
+
+A trace is a tree of timed spans (chat calls, image requests, downloads,
+decoding, rendering, ...) with parent/child links. The current trace and span
+live in context variables, so `span()` calls anywhere below `trace()` attach
+to the right parent, including in worker threads started with
+`in_current_context()`. Outside a trace, `span()` costs next to nothing. A
+trace taken later elsewhere, such as the page rendering a background job's
+results, can be grafted onto the run's spans.
+
+Finished traces are written as JSONL, one span per line, to TRACE_DIR.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from response_cache import CONTENT_CACHE_DIR
+
+# Where traces are written, and how many of the most recent trace files are kept
+TRACE_DIR = os.environ.get("TRACE_DIR", os.path.join(CONTENT_CACHE_DIR, "traces"))
+TRACE_KEEP = int(os.environ.get("TRACE_KEEP", "200"))
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """Thread-safe collection of the finished spans of one run"""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._spans = []
+
+    def add(self, record):
+        with self._lock:
+            self._spans.append(record)
+
+    # Finished spans in start order, with their start relative to the trace (seconds)
+    def spans(self):
+        with self._lock:
+            spans = sorted(self._spans, key=lambda record: record["start"])
+        return [{**record, "offset": record["start"] - self.started} for record in spans]
+
+
+# Start a trace with a root span; yields the Trace
+@contextmanager
+def trace(name, **attributes):
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        with span(name, **attributes):
+            yield current
+    finally:
+        _current_trace.reset(token)
+
+
+# Time a stage as a child of the current span. Yields the span's attribute dict, so
+# results known only inside the block (status codes, sizes, ...) can be added to it
+@contextmanager
+def span(name, **attributes):
+    current = _current_trace.get()
+    if current is None:
+        yield attributes
+        return
+
+    parent = _current_span.get()
+    record = {
+        "trace_id": current.trace_id,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "thread": threading.current_thread().name,
+        "start": time.time(),
+        "attributes": attributes,
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - started
+        _current_span.reset(token)
+        current.add(record)
+
+
+# Wrap `fn` to run in a copy of the caller's context (current trace and span) when it is
+# called from another thread; each submitted task needs its own copy
+def in_current_context(fn):
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# The spans of `finished` as part of an earlier run's `spans`: its root span becomes a child of
+# that run's root, and offsets are relative to the run's start (e.g. for rendering the results
+# of a run that was traced on another thread)
+def graft(spans, finished):
+    root = spans[0]
+    started = root["start"] - root["offset"]
+    return [
+        {
+            **record, "trace_id": root["trace_id"], "parent_id": record["parent_id"] or root["span_id"],
+            "offset": record["start"] - started,
+        }
+        for record in finished.spans()
+    ]
+
+
+# Write the spans of a trace as JSONL and return the file path; older traces beyond
+# TRACE_KEEP are removed
+def write_trace(finished, directory=TRACE_DIR):
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(finished.started))
+    path = os.path.join(directory, f"{stamp}-{finished.trace_id}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for record in finished.spans():
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".jsonl"))
+    for name in names[:-TRACE_KEEP] if TRACE_KEEP > 0 else []:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return path
@@ -0,0 +1,230 @@
+"""
+Token, image and cost accounting
+
+Every chat call records the prompt, cached and completion tokens from the
+`usage` block of its response, and every image call records its count,
+quality and size, per platform. Runs are summarised with an estimated cost
+and appended to a local history, so the spend can be broken down by platform
+over time. A pre-flight estimate prices a run from the rendered prompts
+before it is sent.
+
+A generator's ledger covers everything it ever sent; calls made under
+`recording_into(ledger)` (including in worker threads started with
+tracing.in_current_context) are recorded in that run's own ledger as well.
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from response_cache import CONTENT_CACHE_DIR
+from prompt_registry import PROMPTS, count_message_tokens, count_tokens
+
+# USD per 1M tokens (input, cached input, output); check the pricing page when models change
+TOKEN_PRICES = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+}
+
+# USD per image by model, quality and size
+IMAGE_PRICES = {
+    ("dall-e-3", "standard", "1024x1024"): 0.040,
+    ("dall-e-3", "hd", "1024x1024"): 0.080,
+}
+
+# Where the per-run usage history is kept
+USAGE_HISTORY_PATH = os.path.join(CONTENT_CACHE_DIR, "usage_history.jsonl")
+
+PLATFORMS = ["linkedin", "twitter", "whatsapp"]
+
+_run_ledger = contextvars.ContextVar("run_ledger", default=None)
+
+
+def chat_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    prices = TOKEN_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    return (
+        (prompt_tokens - cached_tokens) * prices["input"]
+        + cached_tokens * prices["cached_input"]
+        + completion_tokens * prices["output"]
+    ) / 1_000_000
+
+
+def image_cost(model, quality, size, count=1):
+    return IMAGE_PRICES.get((model, quality, size), 0.0) * count
+
+
+def _empty_totals():
+    return {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "images": 0, "cost": 0.0, "calls": 0, "reused": 0}
+
+
+class UsageLedger:
+    """Thread-safe record of the API usage of one run, per platform"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = []
+
+    # Record a chat call. `usage` is the response's usage block; without one (e.g. a stream
+    # from a server that doesn't report it) the tokens are counted locally. `reused` marks
+    # responses served from the local cache, which cost nothing
+    def record_chat(self, platform, kind, payload, usage=None, content="", reused=False):
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        else:
+            prompt_tokens = count_message_tokens(*(message["content"] for message in payload["messages"]))
+            completion_tokens = count_tokens(content)
+            cached_tokens = 0
+
+        entry = {
+            "platform": platform,
+            "kind": kind,
+            "model": payload["model"],
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "images": 0,
+            "reused": reused,
+            "estimated": not usage,
+            "cost": 0.0 if reused else chat_cost(payload["model"], prompt_tokens, completion_tokens, cached_tokens),
+        }
+        self._add(entry)
+
+    # Record an image call; `reused` marks images served from the local image store
+    def record_image(self, platform, model, quality, size, count=1, reused=False):
+        entry = {
+            "platform": platform,
+            "kind": "image",
+            "model": model,
+            "quality": quality,
+            "size": size,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "images": count,
+            "reused": reused,
+            "estimated": False,
+            "cost": 0.0 if reused else image_cost(model, quality, size, count),
+        }
+        self._add(entry)
+
+    def _add(self, entry):
+        with self._lock:
+            self.entries.append(entry)
+        run = _run_ledger.get()
+        if run is not None and run is not self:
+            run._add(entry)
+
+    # Totals per platform plus a "total" row
+    def summary(self):
+        with self._lock:
+            entries = list(self.entries)
+
+        totals = {}
+        for entry in entries:
+            for key in (entry["platform"], "total"):
+                row = totals.setdefault(key, _empty_totals())
+                for field in ("prompt_tokens", "cached_tokens", "completion_tokens", "images", "cost"):
+                    row[field] += entry[field]
+                row["calls"] += 1
+                row["reused"] += entry["reused"]
+        return totals
+
+
+# Record the usage of the calls made inside the block into `ledger` too, e.g. to give one
+# run of a generator that is used for several runs its own figures
+@contextmanager
+def recording_into(ledger):
+    token = _run_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _run_ledger.reset(token)
+
+
+# Cost of one content set before it is generated: the rendered prompts counted locally,
+# the completions at their max_tokens budget (an upper bound) and the four images
+def preflight_estimate(topic, persona, tone, image_quality="Standard", variants=1):
+    ledger = UsageLedger()
+    for platform in PLATFORMS:
+        prompt = PROMPTS.text_prompt(topic, persona, tone, platform)
+        # Variants share the prompt; each one has its own completion budget
+        ledger.record_chat(platform, "text", {"model": "gpt-4o", "messages": []}, {
+            "prompt_tokens": prompt.tokens, "completion_tokens": prompt.max_tokens * variants
+        })
+
+    style_guide = PROMPTS.style_guide_prompt(topic)
+    ledger.record_chat("linkedin", "style_guide", {"model": "gpt-4o", "messages": []}, {
+        "prompt_tokens": style_guide.tokens, "completion_tokens": style_guide.max_tokens
+    })
+
+    quality = "hd" if image_quality == "HD" else "standard"
+    ledger.record_image("linkedin", "dall-e-3", quality, "1024x1024", count=3)
+    # Twitter and WhatsApp share one image
+    ledger.record_image("whatsapp", "dall-e-3", quality, "1024x1024")
+    return ledger.summary()
+
+
+class UsageHistory:
+    """Append-only JSONL log of the usage summary of every run, with running totals"""
+
+    def __init__(self, path=USAGE_HISTORY_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # Totals of the records up to _offset bytes into the file, which only ever grows
+        self._offset = 0
+        self._totals = {}
+        self._runs = 0
+
+    def append(self, summary, **details):
+        record = {"time": time.time(), **details, "usage": summary}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def load(self):
+        records = []
+        with self._lock:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            # A line cut short by a crash mid-write
+                            continue
+            except FileNotFoundError:
+                pass
+        return records
+
+    # Totals per platform over all recorded runs, and the number of runs. Only the records
+    # appended since the last call are read (by this or any other process, e.g. a batch run)
+    def totals_by_platform(self):
+        with self._lock:
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            # Still being written; read again next time
+                            break
+                        self._offset += len(line)
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # A line cut short by a crash mid-write
+                            continue
+                        for platform, row in record["usage"].items():
+                            total = self._totals.setdefault(platform, _empty_totals())
+                            for field, value in row.items():
+                                total[field] += value
+                        self._runs += 1
+            except FileNotFoundError:
+                pass
+            return {platform: dict(row) for platform, row in self._totals.items()}, self._runs
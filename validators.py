@@ -0,0 +1,189 @@
+"""
+Local checks and repairs of generated posts
+
+The text prompts set hard rules (a tweet fits in 280 characters, a WhatsApp
+message uses *bold* and short lines, no AI-cliché phrases). Every generated
+post goes through its platform's PostValidator before it is shown:
+
+- repair: deterministic local fixes (surrounding quotes, whitespace runs,
+  markdown the platform doesn't render, cliché lead-ins such as "Hot take:",
+  surplus trailing hashtags, a tweet trimmed to its last full sentence)
+- check: what is still wrong after the repair, as Violations, each with the
+  instruction a short fix-up request sends back to the model
+
+The rules come from the "rules" of each platform in prompts/platforms.json and
+the phrases from prompts/banned_phrases.json; the phrases of a platform are
+compiled into one case-insensitive pattern, so a post is scanned once.
+Lengths are counted in graphemes (an emoji with its modifiers is one), and
+tweets with Twitter's weighting (emoji and CJK count twice, links 23).
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from prompt_registry import PROMPTS
+from text_normalize import graphemes
+
+# Length Twitter counts for every link
+TWEET_URL_LENGTH = 23
+
+# A rule a post breaks, and what to ask the model to change about it
+Violation = namedtuple("Violation", ["rule", "detail", "fix"])
+
+_URL = re.compile(r"https?://\S+")
+_HASHTAG = re.compile(r"#\w+")
+_TRAILING_HASHTAGS = re.compile(r"(?:\s*#\w+)+\s*$")
+_WORD = re.compile(r"\w+(?:['’]\w+)*")
+_BOLD = re.compile(r"(?<![*\w])\*[^*\n]+\*(?![*\w])")
+_SENTENCE_END = re.compile(r"[.!?](?=\s|$)")
+
+# Code points Twitter counts once; everything else (emoji, CJK, ...) counts twice
+_TWEET_LIGHT_RANGES = [(0, 4351), (8192, 8205), (8208, 8223), (8242, 8247)]
+
+
+# Length of a tweet as Twitter counts it
+def tweet_length(text):
+    length = TWEET_URL_LENGTH * len(_URL.findall(text))
+    for cluster in graphemes(_URL.sub("", text)):
+        code = ord(cluster[0])
+        emoji = any(char in ("\ufe0f", "\u200d") for char in cluster)
+        length += 1 if not emoji and any(low <= code <= high for low, high in _TWEET_LIGHT_RANGES) else 2
+    return length
+
+
+def _phrase_pattern(phrase):
+    pattern = re.escape(phrase).replace("'", "['’]")
+    if phrase[0].isalnum():
+        pattern = r"\b" + pattern
+    if phrase[-1].isalnum():
+        pattern += r"\b"
+    return pattern
+
+
+class PostValidator:
+    """Checks and local repairs of the posts of one platform"""
+
+    def __init__(self, platform, rules, banned_phrases):
+        self.platform = platform
+        self.rules = rules
+        # Longest first, so the longer of two overlapping phrases is the one reported
+        phrases = sorted(set(banned_phrases), key=len, reverse=True)
+        self._banned = re.compile("|".join(_phrase_pattern(phrase) for phrase in phrases), re.I) if phrases else None
+        # Labels such as "Hot take:" can simply be dropped where they open a line
+        labels = [phrase for phrase in phrases if phrase.endswith(":")]
+        self._lead_ins = re.compile(r"^[ \t]*(?:" + "|".join(map(re.escape, labels)) + r")[ \t]*", re.I | re.M) if labels else None
+
+    # Deterministic local fixes; a post that needs none comes back unchanged
+    def repair(self, text):
+        text = text.strip()
+        # The whole post wrapped in quotes, as models sometimes return it
+        if len(text) > 1 and text[0] == text[-1] and text[0] in "\"'" and text.count(text[0]) == 2:
+            text = text[1:-1].strip()
+        if self._lead_ins is not None:
+            text, removed = self._lead_ins.subn("", text)
+            if removed:
+                text = text[:1].upper() + text[1:]
+
+        markdown = self.rules.get("markdown")
+        if markdown == "whatsapp":
+            # WhatsApp's own markup: *bold* and _italic_, no headings
+            text = re.sub(r"\*\*([^*\n]+)\*\*", r"*\1*", text)
+            text = re.sub(r"__([^_\n]+)__", r"_\1_", text)
+            text = re.sub(r"^#{1,6}\s+(.+)$", r"*\1*", text, flags=re.M)
+        elif markdown == "strip":
+            # Shown as typed on LinkedIn and Twitter
+            text = re.sub(r"\*\*([^*\n]+)\*\*", r"\1", text)
+            text = re.sub(r"^#{1,6}\s+", "", text, flags=re.M)
+
+        text = re.sub(r"[ \t]+$", "", text, flags=re.M)
+        text = re.sub(r"\n{3,}", "\n\n", text)
+
+        max_hashtags = self.rules.get("max_hashtags")
+        if max_hashtags is not None and len(_HASHTAG.findall(text)) > max_hashtags:
+            # Only the closing run of hashtags is trimmed; ones inside a sentence are part of it
+            trailing = _TRAILING_HASHTAGS.search(text)
+            if trailing:
+                keep = max(max_hashtags - len(_HASHTAG.findall(text[:trailing.start()])), 0)
+                tags = _HASHTAG.findall(trailing.group())[:keep]
+                text = text[:trailing.start()] + (" " + " ".join(tags) if tags else "")
+
+        max_chars = self.rules.get("max_chars")
+        if max_chars is not None and tweet_length(text) > max_chars:
+            text = self._shorten(text, max_chars)
+        return text.strip()
+
+    # Fit a tweet by dropping its closing hashtags, then by ending it at its last full sentence
+    # within the limit if that keeps most of it; otherwise it is left to the fix-up request
+    def _shorten(self, text, max_chars):
+        trailing = _TRAILING_HASHTAGS.search(text)
+        if trailing and tweet_length(text[:trailing.start()]) <= max_chars:
+            return text[:trailing.start()]
+        ends = [match.end() for match in _SENTENCE_END.finditer(text) if tweet_length(text[:match.end()]) <= max_chars]
+        if ends and ends[-1] >= len(text) * 0.75:
+            return text[:ends[-1]]
+        return text
+
+    # What is still wrong with `text`
+    def check(self, text):
+        violations = []
+        rules = self.rules
+
+        max_chars = rules.get("max_chars")
+        if max_chars is not None:
+            length = tweet_length(text)
+            if length > max_chars:
+                violations.append(Violation(
+                    "max_chars", f"{length} characters",
+                    f"It is {length} characters long; shorten it to at most {max_chars} characters."
+                ))
+
+        max_words = rules.get("max_words")
+        if max_words is not None:
+            words = len(_WORD.findall(text))
+            if words > max_words:
+                violations.append(Violation(
+                    "max_words", f"{words} words", f"It has {words} words; cut it to at most {max_words} words."
+                ))
+
+        max_hashtags = rules.get("max_hashtags")
+        if max_hashtags is not None:
+            hashtags = len(_HASHTAG.findall(text))
+            if hashtags > max_hashtags:
+                violations.append(Violation(
+                    "max_hashtags", f"{hashtags} hashtags", f"Use at most {max_hashtags} hashtags."
+                ))
+
+        min_bold = rules.get("min_bold")
+        if min_bold and len(_BOLD.findall(text)) < min_bold:
+            violations.append(Violation(
+                "min_bold", "no *bold* key point", "Put the key point in *asterisks* (WhatsApp bold)."
+            ))
+
+        max_line_chars = rules.get("max_line_chars")
+        if max_line_chars is not None:
+            long_lines = [line for line in text.splitlines() if len(graphemes(line)) > max_line_chars]
+            if long_lines:
+                violations.append(Violation(
+                    "max_line_chars", f"{len(long_lines)} long lines",
+                    f"Break lines longer than {max_line_chars} characters into shorter ones."
+                ))
+
+        if self._banned is not None:
+            found = list(dict.fromkeys(match.group() for match in self._banned.finditer(text)))
+            if found:
+                quoted = ", ".join(f'"{phrase}"' for phrase in found)
+                violations.append(Violation(
+                    "banned_phrases", quoted, f"Rephrase these cliché phrases in your own words: {quoted}."
+                ))
+        return violations
+
+
+# The validator of a platform, built once per process from the prompts' rules and phrases
+@lru_cache(maxsize=None)
+def post_validator(platform):
+    return PostValidator(
+        platform,
+        PROMPTS.platforms[platform].get("rules", {}),
+        PROMPTS.banned_phrases.get("all", []) + PROMPTS.banned_phrases.get(platform, [])
+    )